@@ -0,0 +1,194 @@
+# alerts.py
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from rules import METRICS, Alert
+
+# --- CONFIGURATION ---
+ALERTS_PATH = os.path.join('data', 'alerts.db')
+SUPPRESS_SECONDS = 60.0  # repeats of an open alert within this gap are folded into it
+PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    device_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    level TEXT NOT NULL,
+    value REAL,
+    limit_value REAL,
+    repeats INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_ts ON alerts (ts);
+CREATE INDEX IF NOT EXISTS idx_alerts_device_ts ON alerts (device_id, ts);
+CREATE INDEX IF NOT EXISTS idx_alerts_kind_ts ON alerts (kind, ts);
+"""
+COLUMNS = ['id', 'ts', 'last_ts', 'device_id', 'metric', 'kind', 'level', 'value', 'limit_value', 'repeats']
+
+
+def prediction_alerts(results, thresholds):
+    """DANGER predictions from InferenceService results as 'prediction' alerts"""
+    alerts = []
+    for r in results:
+        for m, (metric, status) in enumerate(zip(METRICS, r['status'])):
+            if status == 'DANGER':
+                alerts.append(Alert(r['time'].timestamp(), r['device'], metric, 'prediction', status,
+                                    r['pred'][m], thresholds[m][1]))
+    return alerts
+
+
+class AlertStore:
+    """Append-only SQLite alert log with suppression of repeats.
+
+    An alert opens a row; further alerts with the same device, metric, kind
+    and level arriving within SUPPRESS_SECONDS of the last one only bump that
+    row's repeat count and last_ts, so a sensor stuck in DANGER produces one
+    row per episode instead of one per reading. Only open episodes are held
+    in memory.
+
+    Implements the LogWriter sink interface, so alerts are written in
+    batches off the ingest thread. Pages are read newest first with a
+    (ts, id) cursor, so any page costs the same however long the log is.
+    """
+
+    def __init__(self, path=ALERTS_PATH, suppress=SUPPRESS_SECONDS):
+        self.path = path
+        self.suppress = suppress
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.open = {}  # (device, metric, kind, level) -> [row id, last_ts, repeats]
+        self.suppressed = 0
+        self._lock = threading.Lock()
+
+    # --- LogWriter sink interface ---
+    def write(self, alerts):
+        with self._lock:
+            # Episode changes are staged and only merged into self.open once the
+            # transaction commits, so a failed write leaves no ids of rolled-back rows
+            staged = {}
+            bumped = {}
+            suppressed = 0
+            newest = max(a.ts for a in alerts)
+            with self.conn:
+                for a in alerts:
+                    key = (a.device, a.metric, a.kind, a.level)
+                    episode = staged.get(key)
+                    if episode is None and key in self.open:
+                        episode = staged[key] = list(self.open[key])
+                    if episode is not None and a.ts - episode[1] <= self.suppress:
+                        episode[1] = max(episode[1], a.ts)
+                        episode[2] += 1
+                        bumped[episode[0]] = episode
+                        suppressed += 1
+                        continue
+                    cur = self.conn.execute(
+                        "INSERT INTO alerts (ts, last_ts, device_id, metric, kind, level, value, limit_value) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (a.ts, a.ts, a.device, a.metric, a.kind, a.level, a.value, a.limit))
+                    staged[key] = [cur.lastrowid, a.ts, 0]
+                self.conn.executemany("UPDATE alerts SET last_ts = ?, repeats = ? WHERE id = ?",
+                                      [(e[1], e[2], row_id) for row_id, e in bumped.items()])
+            self.open.update(staged)
+            self.suppressed += suppressed
+            for key in [k for k, e in self.open.items() if newest - e[1] > self.suppress]:
+                del self.open[key]
+
+    def fsync(self):
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # --- Queries ---
+    def page(self, before=None, limit=PAGE_SIZE, device=None, kind=None, level=None):
+        """One page of alerts, newest first, as (DataFrame, cursor for the next page or None)
+
+        `before` is the cursor returned by the previous page.
+        """
+        clauses, params = [], []
+        if before is not None:
+            clauses.append("(ts < ? OR (ts = ? AND id < ?))")
+            params.extend([before[0], before[0], before[1]])
+        for column, value in (('device_id', device), ('kind', kind), ('level', level)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        sql = f"SELECT {', '.join(COLUMNS)} FROM alerts{where} ORDER BY ts DESC, id DESC LIMIT ?"
+        with sqlite3.connect(self.path) as conn:
+            df = pd.read_sql_query(sql, conn, params=[*params, limit + 1])
+        cursor = None
+        if len(df) > limit:
+            df = df.iloc[:limit]
+            cursor = (float(df['ts'].iloc[-1]), int(df['id'].iloc[-1]))
+        return _with_times(df), cursor
+
+    def query(self, start=None, end=None, devices=None):
+        """Every alert with start <= ts < end, oldest first"""
+        sql, params = _range_query(start, end, devices)
+        with sqlite3.connect(self.path) as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        return _with_times(df)
+
+    def iter_query(self, start=None, end=None, devices=None, kind=None, level=None, chunksize=100000):
+        """Like query(), filtered by kind / level too, as DataFrames of at most `chunksize` rows"""
+        sql, params = _range_query(start, end, devices, kind, level)
+        # A streaming export may resume the generator on a different executor thread
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            for df in pd.read_sql_query(sql, conn, params=params, chunksize=chunksize):
+                yield _with_times(df)
+        finally:
+            conn.close()
+
+    def total(self):
+        """Number of alert rows (ids are never reused or deleted)"""
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute("SELECT IFNULL(MAX(id), 0) FROM alerts").fetchone()[0]
+
+    def devices(self):
+        with sqlite3.connect(self.path) as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT device_id FROM alerts")]
+
+    def stats(self):
+        with self._lock:
+            return {'open_episodes': len(self.open), 'suppressed': self.suppressed}
+
+
+def _range_query(start=None, end=None, devices=None, kind=None, level=None):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("ts < ?")
+        params.append(end)
+    if devices:
+        clauses.append(f"device_id IN ({', '.join('?' * len(devices))})")
+        params.extend(devices)
+    for column, value in (('kind', kind), ('level', level)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return f"SELECT {', '.join(COLUMNS)} FROM alerts{where} ORDER BY ts", params
+
+
+def _with_times(df):
+    df.insert(0, 'time', [datetime.fromtimestamp(ts) for ts in df['ts']])
+    df.insert(1, 'last', [datetime.fromtimestamp(ts) for ts in df['last_ts']])
+    return df.drop(columns=['ts', 'last_ts'])
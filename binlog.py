@@ -0,0 +1,219 @@
+# binlog.py
+"""Append-only binary reading log: fixed-width records behind a small header.
+
+    python binlog.py to-bin data/gas_log.csv      # convert a CSV log -> data/gas_log.bin
+    python binlog.py to-csv data/gas_log.bin      # and back -> data/gas_log.bin.csv
+    python binlog.py info data/gas_log.bin        # header, record count and load time
+
+Every reading is one RECORD (64 bytes, little-endian), so a log is read by
+mapping it as a NumPy structured array: no parsing, and only the pages that
+are touched are read from disk. The header stores the schema version, the
+record size and the record count; the count is only advanced after the
+records are written, so a reader (or a restart after a crash) never sees a
+half-written reading, and preallocated space past the count is ignored.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+
+from devices import MAX_ID_BYTES, check_device_id
+from storage import LEGACY_DEVICE, LEGACY_INTERVAL
+
+# --- CONFIGURATION ---
+BINLOG_PATH = os.path.join('data', 'gas_log.bin')
+MAGIC = b'SSBINLOG'
+SCHEMA_VERSION = 1
+HEADER_SIZE = 256
+GROW_RECORDS = 1 << 16   # file grows this many records at a time (4 MB)
+CHUNK_ROWS = 1000000
+CSV_COLUMNS = ['lat', 'lon', 'co', 'gas', 'temp']
+
+RECORD = np.dtype([
+    ('ts', '<f8'),
+    ('lat', '<f8'),
+    ('lon', '<f8'),
+    ('co', '<f8'),
+    ('gas', '<f8'),
+    ('temp', '<f8'),
+    ('device', f'S{MAX_ID_BYTES}'),
+])
+
+# magic, schema version, header size, record size, record count, created (epoch s)
+HEADER = struct.Struct('<8sHHIQd')
+COUNT_OFFSET = 16
+
+
+def _header_bytes(count, created):
+    schema = json.dumps(RECORD.descr).encode()
+    head = HEADER.pack(MAGIC, SCHEMA_VERSION, HEADER_SIZE, RECORD.itemsize, count, created)
+    return (head + schema).ljust(HEADER_SIZE, b'\0')
+
+
+def read_header(path):
+    """Header fields of a binary log; raises ValueError if it is not one this code can read"""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER.size or raw[:8] != MAGIC:
+        raise ValueError(f"{path} is not a binary reading log")
+    magic, version, header_size, record_size, count, created = HEADER.unpack_from(raw)
+    if version != SCHEMA_VERSION or record_size != RECORD.itemsize or header_size != HEADER_SIZE:
+        raise ValueError(f"{path}: unsupported log schema v{version} ({record_size}-byte records)")
+    return {'version': version, 'record_size': record_size, 'count': count, 'created': created}
+
+
+def read_log(path):
+    """Map a binary log as a read-only structured array of RECORD (zero parsing)"""
+    count = read_header(path)['count']
+    if count == 0:
+        return np.empty(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def to_records(readings):
+    """Reading dicts as produced by IngestService -> RECORD array.
+
+    Raises ValueError for a device id that does not fit the field rather
+    than truncating it into another device's id.
+    """
+    return np.array([(r['time'].timestamp(), np.nan if r['lat'] is None else r['lat'],
+                      np.nan if r['lng'] is None else r['lng'], r['co'], r['gas'], r['temp'],
+                      check_device_id(r['device']).encode()) for r in readings], dtype=RECORD)
+
+
+class BinarySink:
+    """LogWriter sink appending RECORDs to a binary log through a memory map.
+
+    The file is preallocated GROW_RECORDS at a time so most batches are a
+    plain memory copy; close() trims it back to the records written.
+    """
+
+    def __init__(self, path=BINLOG_PATH, grow=GROW_RECORDS):
+        self.path = path
+        self.grow = grow
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            with open(path, 'wb') as f:
+                f.write(_header_bytes(0, time.time()))
+        self.count = read_header(path)['count']
+        self.f = open(path, 'r+b')
+        self.mm = None
+        self.capacity = 0
+        self._map(max(self.count, 1))
+
+    def write(self, readings):
+        self.append(to_records(readings))
+
+    def append(self, records):
+        """Append a RECORD array"""
+        n = len(records)
+        if self.count + n > self.capacity:
+            self._map(self.count + n)
+        view = np.frombuffer(self.mm, dtype=RECORD, count=n, offset=HEADER_SIZE + self.count * RECORD.itemsize)
+        view[:] = records
+        del view  # no buffer exports may outlive a remap
+        self.count += n
+        # Publish the records only once they are in place
+        self.mm[COUNT_OFFSET:COUNT_OFFSET + 8] = struct.pack('<Q', self.count)
+
+    def fsync(self):
+        self.mm.flush()
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.mm.flush()
+        self.mm.close()
+        self.mm = None
+        self.f.truncate(HEADER_SIZE + self.count * RECORD.itemsize)
+        self.f.close()
+
+    def _map(self, needed):
+        capacity = -(-needed // self.grow) * self.grow
+        if self.mm is not None:
+            self.mm.close()
+        size = HEADER_SIZE + capacity * RECORD.itemsize
+        if os.fstat(self.f.fileno()).st_size < size:
+            self.f.truncate(size)
+        self.mm = mmap.mmap(self.f.fileno(), size)
+        self.capacity = capacity
+
+
+def csv_to_binary(csv_path, out_path, device=LEGACY_DEVICE, chunksize=CHUNK_ROWS):
+    """Convert a `lat,lon,co,gas,temp` CSV log; timestamps are assigned like storage.migrate_csv"""
+    with open(csv_path) as f:
+        total = sum(1 for _ in f) - 1
+    device = check_device_id(device)
+    first_ts = os.path.getmtime(csv_path) - max(total - 1, 0) * LEGACY_INTERVAL
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    sink = BinarySink(out_path, grow=max(total, 1))
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, float_precision='round_trip'):
+            records = np.zeros(len(chunk), dtype=RECORD)
+            records['ts'] = first_ts + chunk.index.to_numpy() * LEGACY_INTERVAL
+            for column in CSV_COLUMNS:
+                records[column] = pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=float)
+            records['device'] = device.encode()
+            sink.append(records)
+    finally:
+        sink.close()
+    return sink.count
+
+
+def binary_to_csv(path, csv_path, chunksize=CHUNK_ROWS):
+    """Write a binary log back out in the `lat,lon,co,gas,temp` CSV format"""
+    records = read_log(path)
+    with open(csv_path, 'w') as f:
+        f.write(','.join(CSV_COLUMNS) + '\n')
+        for start in range(0, len(records), chunksize):
+            chunk = records[start:start + chunksize]
+            df = pd.DataFrame({c: chunk[c] for c in CSV_COLUMNS})
+            for column in ('co', 'gas'):
+                # Integer sensors go back out as integers, as the CSV logger wrote them
+                values = df[column].to_numpy()
+                if np.isfinite(values).all() and (values == np.round(values)).all():
+                    df[column] = values.astype(np.int64)
+            df.to_csv(f, header=False, index=False)
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary reading log tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    to_bin = sub.add_parser('to-bin', help="convert a CSV log to the binary format")
+    to_bin.add_argument('csv')
+    to_bin.add_argument('--out', default=BINLOG_PATH)
+    to_bin.add_argument('--device', default=LEGACY_DEVICE)
+    to_csv = sub.add_parser('to-csv', help="convert a binary log to CSV")
+    to_csv.add_argument('binlog')
+    to_csv.add_argument('--out')
+    info = sub.add_parser('info', help="show the header and time a full load")
+    info.add_argument('binlog', nargs='?', default=BINLOG_PATH)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == 'to-bin':
+        n = csv_to_binary(args.csv, args.out, args.device)
+        print(f"✅ Wrote {n} readings to {args.out} in {time.perf_counter() - started:.1f}s")
+    elif args.command == 'to-csv':
+        out = args.out or args.binlog + '.csv'
+        n = binary_to_csv(args.binlog, out)
+        print(f"✅ Wrote {n} readings to {out} in {time.perf_counter() - started:.1f}s")
+    elif args.command == 'info':
+        print(json.dumps(read_header(args.binlog)))
+        records = read_log(args.binlog)
+        mean_gas = float(np.nanmean(records['gas'])) if len(records) else float('nan')  # touches every record
+        print(f"Loaded {len(records)} readings in {(time.perf_counter() - started) * 1000:.0f} ms "
+              f"(mean gas {mean_gas:.1f})")
+
+
+if __name__ == '__main__':
+    main()
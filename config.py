@@ -0,0 +1,153 @@
+# config.py
+import copy
+import json
+import os
+import threading
+import time
+
+from resources import file_signature
+
+# --- CONFIGURATION ---
+CONFIG_PATH = os.path.join('data', 'settings.json')
+CHECK_INTERVAL = 1.0  # seconds between checks for edits made to the file by hand
+METRICS = ('gas', 'co', 'temp')
+
+DEFAULTS = {
+    'esp_url': "http://10.159.194.155/data",  # used when devices.json is missing
+    'device_urls': {},                          # device id -> endpoint override
+    'thresholds': {'gas': [500, 1000], 'co': [50, 200], 'temp': [29, 40]},  # [safe, warning]
+    'update_interval_ms': 500,
+    'retention': {
+        'log_days': 30,             # raw log segments older than this are deleted
+        'log_max_mb': 4096,         # ...as are the oldest ones beyond this total size
+        'compress_after_hours': 24,  # sealed segments older than this are gzipped
+        'raw_days': 30,             # store: raw readings kept this long, then only rollups
+        'second_rollup_days': 90,   # store: 1 s buckets
+        'minute_rollup_days': 730,  # store: 1 min buckets (1 h buckets are kept forever)
+    },
+}
+
+
+class Settings:
+    """Immutable snapshot of the runtime configuration"""
+
+    __slots__ = ('version', 'esp_url', 'device_urls', 'thresholds', 'update_interval_ms', 'retention', 'data')
+
+    def __init__(self, data, version):
+        self.version = version
+        self.data = data
+        self.esp_url = data['esp_url']
+        self.device_urls = dict(data['device_urls'])
+        # (safe, warning) per metric in METRICS order, as the rules engine and classify() expect
+        self.thresholds = tuple((float(data['thresholds'][m][0]), float(data['thresholds'][m][1])) for m in METRICS)
+        self.update_interval_ms = int(data['update_interval_ms'])
+        self.retention = {key: float(value) for key, value in data['retention'].items()}
+
+    def threshold(self, metric):
+        return self.thresholds[METRICS.index(metric)]
+
+
+def validate(data):
+    """Merged settings dict -> Settings-ready dict; raises ValueError on bad values"""
+    for m in METRICS:
+        safe, warning = data['thresholds'][m]
+        if not safe < warning:
+            raise ValueError(f"{m}: safe threshold must be below warning threshold")
+    if not 50 <= int(data['update_interval_ms']) <= 10000:
+        raise ValueError("update_interval_ms must be between 50 and 10000")
+    for key, value in data['retention'].items():
+        if key not in DEFAULTS['retention']:
+            raise ValueError(f"Unknown retention setting {key!r}")
+        if not float(value) > 0:
+            raise ValueError(f"retention.{key} must be positive")
+    if not isinstance(data['device_urls'], dict):
+        raise ValueError("device_urls must map device ids to URLs")
+    return data
+
+
+class ConfigStore:
+    """File-backed runtime configuration with change notification.
+
+    get() returns the current Settings snapshot; swapping the reference is
+    atomic, so a reader holding one snapshot always sees a consistent set of
+    values. update() validates, writes the file (tmp + rename) and notifies
+    subscribers; edits made to the file directly are picked up by get() at
+    most CHECK_INTERVAL seconds later. An invalid file keeps the previous
+    settings and records the error.
+    """
+
+    def __init__(self, path=CONFIG_PATH, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.listeners = []
+        self.error = ""
+        self.signature = None
+        self.checked_at = None
+        self.current = Settings(copy.deepcopy(DEFAULTS), 0)
+        self._lock = threading.Lock()
+        self._reload()
+
+    def subscribe(self, callback):
+        """Call `callback(settings)` after every change, and once right away"""
+        self.listeners.append(callback)
+        callback(self.current)
+
+    def get(self):
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= self.check_interval:
+            self.checked_at = now
+            if file_signature([self.path]) != self.signature:
+                self._reload()
+        return self.current
+
+    def update(self, **changes):
+        """Apply top-level changes (nested dicts are merged) and persist them"""
+        with self._lock:
+            data = _merge(self.current.data, changes)
+            settings = Settings(validate(data), self.current.version + 1)
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+            self.signature = file_signature([self.path])
+            self.current = settings
+        self._notify(settings)
+        return settings
+
+    def _reload(self):
+        with self._lock:
+            signature = file_signature([self.path])
+            if signature == self.signature:
+                return
+            self.signature = signature
+            if not os.path.isfile(self.path):
+                return
+            try:
+                with open(self.path) as f:
+                    data = _merge(DEFAULTS, json.load(f))
+                settings = Settings(validate(data), self.current.version + 1)
+            except (ValueError, KeyError, TypeError) as e:
+                self.error = str(e)
+                return
+            self.error = ""
+            self.current = settings
+        self._notify(settings)
+
+    def _notify(self, settings):
+        for callback in self.listeners:
+            callback(settings)
+
+
+def _merge(base, changes):
+    merged = copy.deepcopy(base)
+    for key, value in changes.items():
+        if key not in DEFAULTS:
+            raise ValueError(f"Unknown setting {key!r}")
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
@@ -1,75 +1,76 @@
 import streamlit as st
-import requests
 import time
-import joblib
+import threading
 import os
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import folium
-from folium.plugins import HeatMap
 from streamlit_folium import st_folium
-import json
-from datetime import datetime, timedelta
+from datetime import datetime
+from urllib.parse import urlencode
+from ingest import IngestService
+from ingest_server import LOCAL_HOST
+from devices import load_devices
+from storage import SensorStore, STORE_PATH
+from retention import SegmentLog, RetentionService, LOG_DIR
+from export import FORMATS, export_routes
+from inference import InferenceService, load_model, model_paths
+from resources import ResourceRegistry
+from online import OnlineLearner
+from heatmap import HeatmapEngine, tile_routes
+from gauges import LiveGauge
+from rules import RulesEngine
+from alerts import AlertStore, ALERTS_PATH, PAGE_SIZE, prediction_alerts
+from log_writer import LogWriter
+from render import RenderScheduler
+from config import ConfigStore, CONFIG_PATH
+from ring import COL, COLUMNS
+from livestate import LivePublisher, LiveState, LIVE_PATH, MAX_DEVICES, STALE_SECONDS
 
 # --- CONFIGURATION ---
-ESP_IP = "http://10.159.194.155/data"
-DATA_PATH = os.path.join('data', 'gas_log.csv')
-
-# --- THRESHOLDS ---
-METHANE_SAFE = 500; METHANE_WARNING = 1000
-CO_SAFE = 50; CO_WARNING = 200
-TEMP_SAFE = 29; TEMP_WARNING = 40
-
-def get_status(value, safe, warning):
-    if value <= safe: return "SAFE"
-    elif value <= warning: return "WARNING"
-    else: return "DANGER"
-
-def create_gauge(value, title, max_val, safe_threshold, warning_threshold):
-    """Create a gauge chart using Plotly"""
-    if value <= safe_threshold:
-        color = "green"
-        status = "SAFE"
-    elif value <= warning_threshold:
-        color = "orange"
-        status = "WARNING"
-    else:
-        color = "red"
-        status = "DANGER"
-    
-    fig = go.Figure(data=[go.Indicator(
-        mode="gauge+number+delta",
-        value=value,
-        title={'text': f"{title}<br><sub>{status}</sub>"},
-        delta={'reference': safe_threshold},
-        gauge={
-            'axis': {'range': [0, max_val]},
-            'bar': {'color': color},
-            'steps': [
-                {'range': [0, safe_threshold], 'color': "#27AE60"},
-                {'range': [safe_threshold, warning_threshold], 'color': "#E67E22"},
-                {'range': [warning_threshold, max_val], 'color': "#E74C3C"}
-            ],
-            'threshold': {
-                'line': {'color': "red", 'width': 2},
-                'thickness': 0.75,
-                'value': warning_threshold
-            }
-        }
-    )])
-    fig.update_layout(margin=dict(l=20, r=20, t=60, b=20), height=300, paper_bgcolor="#1A1A2E", plot_bgcolor="#0F0F1E", font=dict(color="#F0F0F0", size=12))
-    return fig
+DEVICES_PATH = 'devices.json'
+TREND_POINTS = 1000  # ~chart width in pixels; bounds points sent per chart
+TREND_RANGES = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400, "Last year": 365 * 86400, "All time": None}
+INGEST_HTTP_PORT = 8600  # sensors may POST batches to /ingest
+INGEST_UDP_PORT = 8601   # or send `device,ts,co,gas,temp` lines over UDP
+# Base URL of the ingest server as the browser sees it (tiles); set it when the dashboard is opened remotely
+TILE_SERVER = os.environ.get('SAFESIGHT_PUBLIC_URL', f"http://localhost:{INGEST_HTTP_PORT}").rstrip('/')
+EXPORT_PORT = 8602  # exports get their own listener, bound to EXPORT_HOST only
+EXPORT_HOST = os.environ.get('SAFESIGHT_EXPORT_HOST', LOCAL_HOST)
+EXPORT_SERVER = os.environ.get('SAFESIGHT_EXPORT_URL', f"http://localhost:{EXPORT_PORT}").rstrip('/')
+MAP_REFRESH_MS = 2000  # the map is the most expensive widget; it refreshes less often than metrics
+STATUS_REFRESH_MS = 1000
+LIVE_POINTS = 300          # readings in the rolling live chart, read straight from the ring buffer
+LIVE_REFRESH_MS = 1000
+HEATMAP_LAYERS = {"Methane (MQ-4)": 'gas', "CO (MQ-9)": 'co', "Temperature": 'temp'}
+
+# Thresholds, device endpoints and the UI update interval are runtime
+# settings (see config.py), edited from the Settings tab.
+
+def format_stat(value, spec, unit=""):
+    """Summary value for a metric card; a metric with no valid readings has None"""
+    return "—" if value is None else f"{value:{spec}}{unit}"
 
 def create_trend_chart(df, column, title, color):
-    """Create trend line chart"""
+    """Create trend line chart
+
+    Downsampled buckets (see SensorStore.query_trend) are drawn as the mean
+    line inside a shaded min/max band.
+    """
     if len(df) == 0:
         return go.Figure()
     
+    x = df['time'] if 'time' in df else df.index
     fig = go.Figure()
+    if f'{column}_max' in df and (df['n'] > 1).any():
+        fig.add_trace(go.Scatter(x=x, y=df[f'{column}_max'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=x, y=df[f'{column}_min'], mode='lines', line=dict(width=0), fill='tonexty',
+                                 fillcolor='rgba(176, 176, 176, 0.25)', name='min/max'))
     fig.add_trace(go.Scatter(
-        x=df.index,
+        x=x,
         y=df[column],
-        mode='lines+markers',
+        mode='lines+markers' if len(df) <= 200 else 'lines',
         name=title,
         line=dict(color=color, width=3),
         marker=dict(size=6)
@@ -131,11 +132,140 @@ def inject_geolocation():
     """
     st.components.v1.html(geolocation_script, height=0)
 
+@st.cache_resource
+def get_config():
+    """Runtime settings shared by every session and background service"""
+    return ConfigStore(CONFIG_PATH)
+
+def current_thresholds():
+    return get_config().get().thresholds
+
+@st.cache_resource
+def get_heatmap_engine():
+    return HeatmapEngine()
+
+@st.cache_resource
+def get_ingest_service():
+    """One fleet poller per process, shared by every browser session"""
+    heatmap = get_heatmap_engine()
+    store = SensorStore(STORE_PATH)
+    config = get_config()
+    # The raw log is a rotating set of binary segments rather than one ever-growing CSV
+    # Exports are streamed by the ingest server too, so they are never held in a Streamlit process.
+    # They are unauthenticated, so they are not served on the public ingest port
+    service = IngestService(load_devices(DEVICES_PATH, config.get().esp_url), None, store=store,
+                            http_port=INGEST_HTTP_PORT, udp_port=INGEST_UDP_PORT, routes=tile_routes(heatmap),
+                            local_port=EXPORT_PORT, local_host=EXPORT_HOST,
+                            local_routes=export_routes(get_segment_log(), get_alert_reader()),
+                            sinks=[get_segment_log()])
+    config.subscribe(service.apply_settings)
+    # Live readings go straight to the heatmap as column arrays; history is folded in off-thread
+    service.subscribe_columns(heatmap.add_columns)
+    cutoff = time.time()
+    threading.Thread(target=heatmap.seed, args=(store.iter_locations(end=cutoff, chunksize=20000),), daemon=True).start()
+    service.start()
+    return service
+
+@st.cache_resource
+def get_rules_engine():
+    """Threshold / rate / anomaly rules over every live reading, shared across sessions"""
+    engine = RulesEngine(current_thresholds)
+    get_ingest_service().subscribe_columns(engine.evaluate_columns)
+    return engine
+
+@st.cache_resource
+def get_alert_writer():
+    """Persistent alert log fed by the rules engine (and DANGER predictions, see below)"""
+    writer = LogWriter([AlertStore(ALERTS_PATH)], flush_rows=100)
+    get_rules_engine().subscribe(writer.write)
+    return writer
+
+@st.cache_resource
+def get_alert_reader():
+    """Processes that do not publish only page through the log the publisher writes"""
+    return AlertStore(ALERTS_PATH)
+
+def get_alert_store():
+    if get_live_publisher() is None:
+        return get_alert_reader()
+    return get_alert_writer().sinks[0]
+
+@st.cache_resource
+def get_segment_log():
+    """Segmented raw reading log; written by the publishing process, read by all"""
+    return SegmentLog(LOG_DIR)
+
+@st.cache_resource
+def get_retention_service():
+    """Rotates, compresses and expires log segments and compacts the store in the background"""
+    return RetentionService(get_segment_log(), get_ingest_service().store, lambda: get_config().get().retention)
+
+@st.cache_resource
+def get_resource_registry():
+    """Models are loaded once per process and hot-reloaded when their files change"""
+    registry = ResourceRegistry()
+    registry.register('hazard_model', load_model, model_paths())
+    return registry
+
+@st.cache_resource
+def get_online_learner():
+    """Keeps learning from live readings; serves in place of the offline model once it is better"""
+    registry = get_resource_registry()
+    learner = OnlineLearner(lambda: registry.get('hazard_model'))
+    get_ingest_service().subscribe(learner.submit)
+    return learner
+
+@st.cache_resource
+def get_inference_service():
+    """One micro-batching model runner per process, fed by the ingest service"""
+    learner = get_online_learner()
+    service = InferenceService(learner.serving, current_thresholds)
+    get_ingest_service().subscribe(service.submit)
+    alert_writer = get_alert_writer()
+
+    def record_danger(results):
+        alerts = prediction_alerts(results, current_thresholds())
+        if alerts:
+            alert_writer.write(alerts)
+
+    service.subscribe(record_danger)
+    service.subscribe(get_live_publisher().publish_predictions)
+    return service
+
+@st.cache_resource
+def get_live_publisher():
+    """Only the server process holding the live lock ingests; None in every other process.
+
+    Behind a load balancer each Streamlit process would otherwise poll the
+    fleet itself; instead the winner publishes readings, predictions and
+    stats into shared memory and all processes render from that.
+    """
+    # Every registered device gets a slot, with the same again spare for devices that only push
+    devices = load_devices(DEVICES_PATH, get_config().get().esp_url)
+    publisher = LivePublisher.acquire(LIVE_PATH, max_devices=max(MAX_DEVICES, 2 * len(devices)))
+    if publisher is None:
+        return None
+    service = get_ingest_service()
+    service.subscribe_columns(publisher.publish)
+    publisher.start_status(service.snapshot)
+    return publisher
+
+@st.cache_resource
+def get_live_state():
+    """Read side of the shared live segment, used by every session"""
+    return LiveState(LIVE_PATH, devices=load_devices(DEVICES_PATH, get_config().get().esp_url),
+                     store=SensorStore(STORE_PATH))
+
+publisher = get_live_publisher()
+leader = publisher is not None
+if leader:
+    retention = get_retention_service()
+
 # --- LOAD AI MODELS ---
 try:
-    m_model = joblib.load('src/methane_model.pkl')
-    c_model = joblib.load('src/co_model.pkl')
-    t_model = joblib.load('src/temp_model.pkl')
+    get_resource_registry().get('hazard_model')
+    if leader:
+        inference = get_inference_service()
     ai_ready = True
     st.sidebar.success("✅ AI Models Loaded")
 except Exception as e:
@@ -297,7 +427,43 @@ else:
 lat = st.session_state.lat
 lng = st.session_state.lng
 
-st.sidebar.info(f"Connected to: {ESP_IP}")
+ingest = get_live_state()
+if leader:
+    st.sidebar.info(f"Polling {len(ingest.devices)} device(s)")
+else:
+    st.sidebar.info(f"{len(ingest.devices)} device(s) · live feed shared by another server process")
+with st.sidebar.expander("📶 Device Stats"):
+    snap = ingest.snapshot()
+    st.dataframe(pd.DataFrame.from_dict(snap['stats'], orient='index'), use_container_width=True)
+    if snap['handler_errors']:
+        st.warning(f"{snap['handler_errors']} readings failed after polling: {snap['handler_error']}")
+    live = snap['live']
+    if live.get('dropped'):
+        st.warning(f"{len(live['dropped_devices'])} device(s) did not fit the {live['slots']} live slots and are "
+                   f"missing from the live views ({live['dropped']} readings, still logged): "
+                   f"{', '.join(live['dropped_devices'])}")
+with st.sidebar.expander("💾 Log Writer"):
+    st.json(ingest.snapshot()['writer'])
+with st.sidebar.expander("🗄️ Log Retention"):
+    st.json(retention.stats() if leader else get_segment_log().status())
+alert_store = get_alert_store()
+with st.sidebar.expander("🚨 Rules"):
+    if leader:
+        rules = get_rules_engine()
+        st.json(rules.stats())
+    st.json(alert_store.stats())
+    if leader:
+        recent = list(rules.recent)[-20:]
+        if recent:
+            st.dataframe(pd.DataFrame([a.as_dict() for a in reversed(recent)]), use_container_width=True)
+if ai_ready:
+    with st.sidebar.expander("🧠 Inference"):
+        if leader:
+            st.json(inference.stats())
+        st.json(get_resource_registry().status())
+        if leader:
+            st.caption("Online learning")
+            st.json(get_online_learner().stats())
 
 # JavaScript to update location from browser geolocation
 st.markdown("""
@@ -337,20 +503,12 @@ if auto_refresh:
     st.rerun()
 
 # Initialize remaining session state
-if 'heatmap_data' not in st.session_state:
-    st.session_state.heatmap_data = []
-if 'current_gas' not in st.session_state:
-    st.session_state.current_gas = 0
-if 'current_co' not in st.session_state:
-    st.session_state.current_co = 0
-if 'current_temp' not in st.session_state:
-    st.session_state.current_temp = 0
 if 'esp_connected' not in st.session_state:
     st.session_state.esp_connected = False
 if 'readings_count' not in st.session_state:
     st.session_state.readings_count = 0
-if 'alert_history' not in st.session_state:
-    st.session_state.alert_history = []
+if 'alert_cursors' not in st.session_state:
+    st.session_state.alert_cursors = [None]  # page start cursors, newest page first
 if 'last_update' not in st.session_state:
     st.session_state.last_update = datetime.now()
 
@@ -381,28 +539,70 @@ with col4:
 
 st.divider()
 
+config = get_config()
+settings = config.get()
+
+# UI frame rate comes from the runtime settings and follows them while running
+scheduler = RenderScheduler(settings.update_interval_ms)
+scheduler.add('map', every_ms=MAP_REFRESH_MS)
+
 # Create main tabs
 tab1, tab2, tab3, tab4 = st.tabs(["📊 Dashboard", "📈 Analytics", "⚙️ Settings", "📋 Logs"])
 
 with tab1:
     st.subheader("📍 SENSOR LOCATION HEATMAP")
     
-    heatmap_mode = st.selectbox("Heatmap based on:", ["Methane (MQ-4)", "CO (MQ-9)", "Temperature"])
-    map_placeholder = st.empty()
+    hm_col1, hm_col2 = st.columns([3, 1])
+    heatmap_mode = hm_col1.selectbox("Heatmap based on:", list(HEATMAP_LAYERS))
+    heatmap_stat = hm_col2.radio("Cell value", ["max", "mean"], horizontal=True)
+    
+    # Built once per script run; the heatmap itself is a tile layer served by
+    # the ingest server and refreshed in place by the browser.
+    m = folium.Map(location=[lat, lng], zoom_start=15)
+    tile_url = f"{TILE_SERVER}/tiles/{HEATMAP_LAYERS[heatmap_mode]}/{{z}}/{{x}}/{{y}}.png?stat={heatmap_stat}"
+    heat_layer = folium.TileLayer(tiles=tile_url, attr="SafeSight heatmap", name="Hazard heatmap", overlay=True, max_zoom=19)
+    heat_layer.add_to(m)
+    folium.CircleMarker(
+        location=[lat, lng],
+        radius=10,
+        popup="<b>Current Location</b>",
+        color='red',
+        fill=True,
+        fillColor='red',
+        fillOpacity=0.8
+    ).add_to(m)
+    m.get_root().script.add_child(folium.Element(f"""
+        setInterval(function() {{
+            {heat_layer.get_name()}.setUrl("{tile_url}&v=" + Date.now());
+        }}, {scheduler.interval_ms('map')});
+    """))
+    st_folium(m, width=1200, height=500, key="hazard_map")
     
     st.subheader("📊 LIVE SENSOR GAUGES")
     
-    col1, col2, col3 = st.columns(3)
-    gauge_gas = col1.empty()
-    gauge_co = col2.empty()
-    gauge_temp = col3.empty()
+    # Figures live in the session and are patched in place on every reading
+    if 'gauges' not in st.session_state:
+        st.session_state.gauges = {
+            'gas': LiveGauge("MQ-4 Methane", 2000, *settings.threshold('gas')),
+            'co': LiveGauge("MQ-9 CO", 500, *settings.threshold('co')),
+            'temp': LiveGauge("Temperature", 60, *settings.threshold('temp')),
+        }
+    gauges = st.session_state.gauges
+    # The cached figures may predate a settings change made here or in another session
+    for metric, gauge in gauges.items():
+        gauge.set_thresholds(*settings.threshold(metric))
     
-    with col1:
-        gauge_gas.plotly_chart(create_gauge(st.session_state.current_gas, "MQ-4 Methane", 2000, METHANE_SAFE, METHANE_WARNING), use_container_width=True)
-    with col2:
-        gauge_co.plotly_chart(create_gauge(st.session_state.current_co, "MQ-9 CO", 500, CO_SAFE, CO_WARNING), use_container_width=True)
-    with col3:
-        gauge_temp.plotly_chart(create_gauge(st.session_state.current_temp, "Temperature", 60, TEMP_SAFE, TEMP_WARNING), use_container_width=True)
+    col1, col2, col3 = st.columns(3)
+    gauges['gas'].attach(col1.empty())
+    gauges['co'].attach(col2.empty())
+    gauges['temp'].attach(col3.empty())
+    # Current values come from the newest row of the last device's ring buffer
+    last = ingest.snapshot()['latest']
+    current = ingest.window(last['device'], 1) if last is not None else []
+    current = current[0].copy() if len(current) else np.zeros(len(COLUMNS))
+    gauges['gas'].show(current[COL['gas']])
+    gauges['co'].show(current[COL['co']])
+    gauges['temp'].show(current[COL['temp']])
     
     st.subheader("📈 LIVE METRICS")
     col1, col2, col3 = st.columns(3)
@@ -410,11 +610,12 @@ with tab1:
     box_co = col2.empty()
     box_temp = col3.empty()
     
-    box_gas.metric("🔴 MQ-4 Methane", f"{st.session_state.current_gas} ppm", delta=None)
-    box_co.metric("🔵 MQ-9 CO", f"{st.session_state.current_co} ppm", delta=None)
-    box_temp.metric("🌡️ Temperature", f"{st.session_state.current_temp}°C", delta=None)
+    box_gas.metric("🔴 MQ-4 Methane", f"{current[COL['gas']]:g} ppm", delta=None)
+    box_co.metric("🔵 MQ-9 CO", f"{current[COL['co']]:g} ppm", delta=None)
+    box_temp.metric("🌡️ Temperature", f"{current[COL['temp']]:g}°C", delta=None)
+    live_chart = st.empty()
     
-    st.subheader("🔮 AI PREDICTION")
+    st.subheader("🔮 AI PREDICTION (next 10 s)")
     p1, p2, p3 = st.columns(3)
     pred_gas = p1.empty()
     pred_co = p2.empty()
@@ -430,204 +631,252 @@ with tab1:
 with tab2:
     st.subheader("📈 HISTORICAL TRENDS")
     
-    if os.path.isfile(DATA_PATH):
-        df = pd.read_csv(DATA_PATH)
+    trend_range = st.selectbox("Time range:", list(TREND_RANGES), index=1)
+    trend_start = time.time() - TREND_RANGES[trend_range] if TREND_RANGES[trend_range] else None
+    trend_df = ingest.store.query_trend(start=trend_start, max_points=TREND_POINTS)
+    
+    if len(trend_df) > 0:
+        col1, col2 = st.columns(2)
         
-        if len(df) > 0:
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                fig_gas = create_trend_chart(df.reset_index(), 'gas', 'Methane Levels (ppm)', '#00D9FF')
-                st.plotly_chart(fig_gas, use_container_width=True)
-                
-                fig_co = create_trend_chart(df.reset_index(), 'co', 'CO Levels (ppm)', '#FF6B6B')
-                st.plotly_chart(fig_co, use_container_width=True)
-            
-            with col2:
-                fig_temp = create_trend_chart(df.reset_index(), 'temp', 'Temperature (°C)', '#FFD700')
-                st.plotly_chart(fig_temp, use_container_width=True)
-            
-            st.subheader("📊 STATISTICS")
-            stats_col1, stats_col2, stats_col3 = st.columns(3)
-            
-            with stats_col1:
-                st.metric("🔴 Methane Max", f"{df['gas'].max():.0f} ppm", f"Avg: {df['gas'].mean():.0f}")
-                st.metric("🔴 Methane Min", f"{df['gas'].min():.0f} ppm")
-            
-            with stats_col2:
-                st.metric("🔵 CO Max", f"{df['co'].max():.0f} ppm", f"Avg: {df['co'].mean():.0f}")
-                st.metric("🔵 CO Min", f"{df['co'].min():.0f} ppm")
-            
-            with stats_col3:
-                st.metric("🌡️ Temp Max", f"{df['temp'].max():.1f}°C", f"Avg: {df['temp'].mean():.1f}")
-                st.metric("🌡️ Temp Min", f"{df['temp'].min():.1f}°C")
+        with col1:
+            fig_gas = create_trend_chart(trend_df, 'gas', 'Methane Levels (ppm)', '#00D9FF')
+            st.plotly_chart(fig_gas, use_container_width=True)
             
-            st.subheader("📥 DATA EXPORT")
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download as CSV",
-                data=csv,
-                file_name=f"sensor_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
-        else:
-            st.info("📊 No data available yet. Connect ESP to start logging.")
+            fig_co = create_trend_chart(trend_df, 'co', 'CO Levels (ppm)', '#FF6B6B')
+            st.plotly_chart(fig_co, use_container_width=True)
+        
+        with col2:
+            fig_temp = create_trend_chart(trend_df, 'temp', 'Temperature (°C)', '#FFD700')
+            st.plotly_chart(fig_temp, use_container_width=True)
+    else:
+        st.info(f"📊 No readings in the {trend_range.lower()}.")
+    
+    segment_log = get_segment_log()
+    # Whole-history statistics come from the segment manifest; no segment is opened
+    log_stats = segment_log.summary()
+    
+    if any(s['count'] for s in log_stats.values()):
+        st.subheader("📊 STATISTICS")
+        stats_col1, stats_col2, stats_col3 = st.columns(3)
+        
+        with stats_col1:
+            st.metric("🔴 Methane Max", format_stat(log_stats['gas']['max'], ".0f", " ppm"),
+                      f"Avg: {format_stat(log_stats['gas']['mean'], '.0f')}")
+            st.metric("🔴 Methane Min", format_stat(log_stats['gas']['min'], ".0f", " ppm"))
+        
+        with stats_col2:
+            st.metric("🔵 CO Max", format_stat(log_stats['co']['max'], ".0f", " ppm"),
+                      f"Avg: {format_stat(log_stats['co']['mean'], '.0f')}")
+            st.metric("🔵 CO Min", format_stat(log_stats['co']['min'], ".0f", " ppm"))
+        
+        with stats_col3:
+            st.metric("🌡️ Temp Max", format_stat(log_stats['temp']['max'], ".1f", "°C"),
+                      f"Avg: {format_stat(log_stats['temp']['mean'], '.1f')}")
+            st.metric("🌡️ Temp Min", format_stat(log_stats['temp']['min'], ".1f", "°C"))
+        
+        st.subheader("📥 DATA EXPORT")
+        # Streamed in chunks by the ingest server; only the segments overlapping the range are opened
+        ex_col1, ex_col2 = st.columns(2)
+        export_devices = ex_col1.multiselect("Devices (all if empty)", [d.id for d in ingest.devices])
+        export_format = ex_col2.selectbox("Format", list(FORMATS), key="export_format")
+        query = {'format': export_format, 'devices': ','.join(export_devices)}
+        if trend_start is not None:
+            query['start'] = f"{trend_start:.3f}"
+        st.link_button(f"📥 Download {trend_range.lower()} ({export_format})",
+                       f"{EXPORT_SERVER}/export/readings?{urlencode(query)}")
+    elif segment_log.status()['segments']:
+        st.info("📊 No data available yet. Connect ESP to start logging.")
     else:
-        st.info("📊 No data file found.")
+        st.info("📊 No sensor log yet.")
 
 with tab3:
     st.subheader("⚙️ SYSTEM SETTINGS")
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("**ESP Configuration**")
-        new_ip = st.text_input("ESP IP Address", value=ESP_IP)
-        if new_ip != ESP_IP:
-            st.info(f"✅ Update ESP_IP in dashboard.py to: {new_ip}")
+    # Saved settings reach the poller, rules engine, inference and gauges on
+    # their next reading; nothing is reloaded
+    with st.form("settings"):
+        col1, col2 = st.columns(2)
         
-        update_interval = st.slider("Update Interval (ms)", 100, 1000, 500, 50)
-        st.caption(f"Current: {update_interval}ms updates")
-    
-    with col2:
-        st.markdown("**Sensor Thresholds**")
-        methane_safe_new = st.slider("Methane Safe (ppm)", 0, 1000, METHANE_SAFE, 50)
-        methane_warn_new = st.slider("Methane Warning (ppm)", 500, 2000, METHANE_WARNING, 50)
-        co_safe_new = st.slider("CO Safe (ppm)", 0, 100, CO_SAFE, 5)
-        co_warn_new = st.slider("CO Warning (ppm)", 50, 500, CO_WARNING, 10)
+        with col1:
+            st.markdown("**ESP Configuration**")
+            device_ids = [d.id for d in ingest.devices]
+            edit_device = st.selectbox("Device", device_ids) if device_ids else None
+            current_url = next((d.url for d in ingest.devices if d.id == edit_device), settings.esp_url)
+            new_url = st.text_input("ESP Endpoint", value=current_url)
+            
+            update_interval = st.slider("Update Interval (ms)", 100, 1000, settings.update_interval_ms, 50)
+            st.caption(f"Current: {settings.update_interval_ms}ms frames, map every {scheduler.interval_ms('map')}ms")
+        
+        with col2:
+            st.markdown("**Sensor Thresholds**")
+            (m_safe, m_warn), (c_safe, c_warn), (t_safe, t_warn) = settings.thresholds
+            methane_safe_new = st.slider("Methane Safe (ppm)", 0, 1000, int(m_safe), 50)
+            methane_warn_new = st.slider("Methane Warning (ppm)", 500, 2000, int(m_warn), 50)
+            co_safe_new = st.slider("CO Safe (ppm)", 0, 100, int(c_safe), 5)
+            co_warn_new = st.slider("CO Warning (ppm)", 50, 500, int(c_warn), 10)
+            temp_safe_new = st.slider("Temp Safe (°C)", 0, 60, int(t_safe), 1)
+            temp_warn_new = st.slider("Temp Warning (°C)", 0, 80, int(t_warn), 1)
+            
+            st.markdown("**Retention**")
+            raw_days_new = st.number_input("Keep raw readings (days)", 1, 3650, int(settings.retention['raw_days']))
+            log_days_new = st.number_input("Keep raw log segments (days)", 1, 3650, int(settings.retention['log_days']))
+        
+        if st.form_submit_button("💾 Apply settings"):
+            changes = {
+                'update_interval_ms': update_interval,
+                'thresholds': {'gas': [methane_safe_new, methane_warn_new], 'co': [co_safe_new, co_warn_new],
+                               'temp': [temp_safe_new, temp_warn_new]},
+                'retention': {'raw_days': raw_days_new, 'log_days': log_days_new},
+            }
+            if edit_device is not None and new_url != current_url:
+                changes['device_urls'] = {edit_device: new_url}
+            try:
+                settings = config.update(**changes)
+                st.success(f"✅ Settings saved (version {settings.version})")
+            except ValueError as e:
+                st.error(f"❌ {e}")
+    if config.error:
+        st.warning(f"⚠️ {CONFIG_PATH} is invalid, keeping previous settings: {config.error}")
 
 with tab4:
     st.subheader("📋 ALERT HISTORY")
     
-    if len(st.session_state.alert_history) > 0:
-        alert_df = pd.DataFrame(st.session_state.alert_history)
+    f_col1, f_col2, f_col3 = st.columns(3)
+    alert_device = f_col1.selectbox("Device", ["All"] + [d.id for d in ingest.devices])
+    alert_kind = f_col2.selectbox("Type", ["All", "prediction", "threshold", "rate", "anomaly"])
+    alert_level = f_col3.selectbox("Level", ["All", "DANGER", "WARNING"])
+    alert_filters = (alert_device, alert_kind, alert_level)
+    if st.session_state.get('alert_filters') != alert_filters:
+        st.session_state.alert_filters = alert_filters
+        st.session_state.alert_cursors = [None]
+    
+    cursors = st.session_state.alert_cursors
+    alert_df, next_cursor = alert_store.page(
+        before=cursors[-1], limit=PAGE_SIZE,
+        device=None if alert_device == "All" else alert_device,
+        kind=None if alert_kind == "All" else alert_kind,
+        level=None if alert_level == "All" else alert_level)
+    
+    if len(alert_df) > 0:
+        st.caption(f"Page {len(cursors)} · {alert_store.total()} alerts recorded · repeats within a minute are folded into one row")
         st.dataframe(alert_df, use_container_width=True)
         
-        st.download_button(
-            label="📥 Download Alert Log",
-            data=alert_df.to_csv(index=False),
-            file_name=f"alerts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mime="text/csv"
-        )
+        nav1, nav2, _ = st.columns([1, 1, 4])
+        if nav1.button("⬅️ Newer", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if nav2.button("Older ➡️", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
+        
+        alert_format = st.selectbox("Export format", list(FORMATS), key="alert_export_format")
+        query = {'format': alert_format}
+        for name, value in (('devices', alert_device), ('kind', alert_kind), ('level', alert_level)):
+            if value != "All":
+                query[name] = value
+        st.link_button("📥 Download alert log (current filters)", f"{EXPORT_SERVER}/export/alerts?{urlencode(query)}")
     else:
         st.info("📋 No alerts recorded yet.")
 
-# INIT CSV
-if not os.path.isfile(DATA_PATH):
-    with open(DATA_PATH, 'w') as f:
-        f.write("lat,lon,co,gas,temp\n")
-
 # Initialize session state for auto-refresh
 if 'running' not in st.session_state:
     st.session_state.running = True
 
 placeholder = st.empty()
 
-# --- MAIN LOOP (POLLING) ---
-while st.session_state.running:
-    try:
-        response = requests.get(ESP_IP, timeout=0.5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            co = int(data['co'])
-            gas = int(data['gas'])
-            temp = float(data['temp'])
-            
-            st.session_state.current_gas = gas
-            st.session_state.current_co = co
-            st.session_state.current_temp = temp
-            st.session_state.esp_connected = True
-            st.session_state.readings_count += 1
-            st.session_state.last_update = datetime.now()
-
-            with open(DATA_PATH, 'a') as f:
-                f.write(f"{lat},{lng},{co},{gas},{temp}\n")
-            
-            gas_intensity = min(gas / 2000, 1.0)
-            co_intensity = min(co / 500, 1.0)
-            temp_intensity = min(temp / 60, 1.0)
-            
-            st.session_state.heatmap_data.append({
-                'lat': lat,
-                'lng': lng,
-                'gas': gas_intensity,
-                'co': co_intensity,
-                'temp': temp_intensity
-            })
-            
-            if len(st.session_state.heatmap_data) > 100:
-                st.session_state.heatmap_data = st.session_state.heatmap_data[-100:]
+def draw_status(status):
+    connected, error = status
+    if connected:
+        placeholder.empty()
+    else:
+        placeholder.warning(f"Waiting for ESP... ({error[:30]})")
+
+def draw_metrics(values):
+    gas, co, temp = values
+    box_gas.metric("🔴 MQ-4 Methane", f"{gas:g} ppm")
+    box_co.metric("🔵 MQ-9 CO", f"{co:g} ppm")
+    box_temp.metric("🌡️ Temperature", f"{temp:g}°C")
+    gauges['gas'].show(gas)
+    gauges['co'].show(co)
+    gauges['temp'].show(temp)
+
+def draw_live_chart(value):
+    device, _ = value  # (device, reading count): the count makes every new batch a new value
+    # One copy of the ring window per draw, straight into the chart frame
+    window = ingest.window(device, LIVE_POINTS)
+    df = pd.DataFrame({m: window[:, COL[m]] for m in ('gas', 'co', 'temp')},
+                      index=pd.Index(window[:, COL['ts']] - window[-1, COL['ts']], name="seconds ago"))
+    live_chart.line_chart(df, height=250)
+
+def draw_prediction(result):
+    (p_m, p_c, p_t), (s_m, s_c, s_t) = result
+    pred_gas.metric("Pred Methane", f"{p_m:.1f}", s_m)
+    pred_co.metric("Pred CO", f"{p_c:.1f}", s_c)
+    pred_temp.metric("Pred Temp", f"{p_t:.1f}", s_t)
+    if "DANGER" in [s_m, s_c, s_t]:
+        final_alert.error("🚨 CRITICAL PREDICTION: DANGER")
+    else:
+        final_alert.success("✅ SYSTEM PREDICTION: SAFE")
+
+def draw_ai_error(error):
+    final_alert.error(f"AI Error: {error[:50]}")
+
+scheduler.add('status', draw_status, every_ms=STATUS_REFRESH_MS)
+scheduler.add('metrics', draw_metrics)
+scheduler.add('live_chart', draw_live_chart, every_ms=LIVE_REFRESH_MS)
+scheduler.add('prediction', draw_prediction)
+scheduler.add('ai_error', draw_ai_error)
+
+# --- MAIN LOOP (RENDER) ---
+# Readings are collected by the IngestService thread of the publishing
+# process; this loop only renders snapshots of the shared live segment.
+# Everything that arrived during a frame is coalesced into its latest value
+# and drawn once by the scheduler.
+if leader:
+    get_ingest_service().set_location(lat, lng)
+current_device = None
+last_pred_time = None
+# The form above may have saved new settings during this run; apply them from the first frame
+applied_version = None
 
-            box_gas.metric("🔴 MQ-4 Methane", f"{gas} ppm")
-            box_co.metric("🔵 MQ-9 CO", f"{co} ppm")
-            box_temp.metric("🌡️ Temperature", f"{temp}°C")
-            
-            gauge_gas.plotly_chart(create_gauge(gas, "MQ-4 Methane", 2000, METHANE_SAFE, METHANE_WARNING), use_container_width=True, key=f"gas_{time.time()}")
-            gauge_co.plotly_chart(create_gauge(co, "MQ-9 CO", 500, CO_SAFE, CO_WARNING), use_container_width=True, key=f"co_{time.time()}")
-            gauge_temp.plotly_chart(create_gauge(temp, "Temperature", 60, TEMP_SAFE, TEMP_WARNING), use_container_width=True, key=f"temp_{time.time()}")
-            
-            m = folium.Map(location=[lat, lng], zoom_start=15)
-            
-            if heatmap_mode == "Methane (MQ-4)":
-                heatmap_points = [[d['lat'], d['lng'], d['gas']] for d in st.session_state.heatmap_data]
-                HeatMap(heatmap_points, min_opacity=0.2, max_zoom=18, radius=25, blur=15, 
-                       gradient={0.0: '#27AE60', 0.5: '#E67E22', 1.0: '#E74C3C'}).add_to(m)
-            elif heatmap_mode == "CO (MQ-9)":
-                heatmap_points = [[d['lat'], d['lng'], d['co']] for d in st.session_state.heatmap_data]
-                HeatMap(heatmap_points, min_opacity=0.2, max_zoom=18, radius=25, blur=15,
-                       gradient={0.0: '#27AE60', 0.5: '#E67E22', 1.0: '#E74C3C'}).add_to(m)
-            else:
-                heatmap_points = [[d['lat'], d['lng'], d['temp']] for d in st.session_state.heatmap_data]
-                HeatMap(heatmap_points, min_opacity=0.2, max_zoom=18, radius=25, blur=15,
-                       gradient={0.0: '#27AE60', 0.5: '#E67E22', 1.0: '#E74C3C'}).add_to(m)
-            
-            folium.CircleMarker(
-                location=[lat, lng],
-                radius=10,
-                popup=f"<b>Current Reading</b><br>Gas: {gas} ppm<br>CO: {co} ppm<br>Temp: {temp}°C",
-                color='red',
-                fill=True,
-                fillColor='red',
-                fillOpacity=0.8
-            ).add_to(m)
-            
-            map_placeholder.empty()
-            with map_placeholder.container():
-                st_folium(m, width=1200, height=500)
-
-            if ai_ready:
-                try:
-                    inp = [[gas, co, temp]]
-                    p_m = m_model.predict(inp)[0]
-                    p_c = c_model.predict(inp)[0]
-                    p_t = t_model.predict(inp)[0]
-
-                    s_m = get_status(p_m, METHANE_SAFE, METHANE_WARNING)
-                    s_c = get_status(p_c, CO_SAFE, CO_WARNING)
-                    s_t = get_status(p_t, TEMP_SAFE, TEMP_WARNING)
-
-                    pred_gas.metric("Pred Methane", f"{p_m:.1f}", s_m)
-                    pred_co.metric("Pred CO", f"{p_c:.1f}", s_c)
-                    pred_temp.metric("Pred Temp", f"{p_t:.1f}", s_t)
-
-                    if "DANGER" in [s_m, s_c, s_t]:
-                        final_alert.error("🚨 CRITICAL PREDICTION: DANGER")
-                        st.session_state.alert_history.append({
-                            'Time': datetime.now().strftime('%H:%M:%S'),
-                            'Type': 'DANGER',
-                            'Methane': f"{p_m:.1f}",
-                            'CO': f"{p_c:.1f}",
-                            'Temp': f"{p_t:.1f}"
-                        })
-                    else:
-                        final_alert.success("✅ SYSTEM PREDICTION: SAFE")
-                except Exception as e:
-                    final_alert.error(f"AI Error: {str(e)[:50]}")
-
-    except Exception as e:
-        st.session_state.esp_connected = False
-        placeholder.warning(f"Waiting for ESP... ({str(e)[:30]})")
-        
-    time.sleep(0.5)
+while st.session_state.running:
+    # One snapshot per frame: a consistent set of values, edits apply from the next frame
+    live = config.get()
+    if live.version != applied_version:
+        settings = live
+        applied_version = live.version
+        scheduler.frame_ms = settings.update_interval_ms
+        for metric, gauge in gauges.items():
+            gauge.set_thresholds(*settings.threshold(metric))
+            gauge.show(current[COL[metric]])
+
+    snap = ingest.snapshot()
+    if not leader and not ingest.alive() and time.monotonic() - st.session_state.get('takeover_at', 0) > STALE_SECONDS:
+        # The publishing process is gone: try to take over ingestion
+        st.session_state.takeover_at = time.monotonic()
+        get_live_publisher.clear()
+        st.rerun()
+    st.session_state.esp_connected = snap['connected']
+    scheduler.update('status', (snap['connected'], snap['error']))
+
+    if snap['connected'] and snap['latest'] is not None:
+        reading = snap['latest']
+        current_device = reading['device']
+
+        current = ingest.window(current_device, 1)[-1].copy()
+        st.session_state.readings_count = snap['count']
+        st.session_state.last_update = snap['last_update']
+        scheduler.update('metrics', (current[COL['gas']], current[COL['co']], current[COL['temp']]))
+        scheduler.update('live_chart', (current_device, snap['count']))
+
+    if ai_ready and current_device is not None:
+        # Predictions are made in batches by the shared InferenceService
+        result = ingest.prediction(current_device)
+        if result is not None and result['time'] != last_pred_time:
+            last_pred_time = result['time']
+            scheduler.update('prediction', (tuple(result['pred']), tuple(result['status'])))
+        elif leader and inference.last_error:
+            scheduler.update('ai_error', inference.last_error)
+
+    scheduler.tick()
+    scheduler.wait()
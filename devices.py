@@ -0,0 +1,146 @@
+# devices.py
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+
+# --- DEFAULTS ---
+DEVICE_TIMEOUT = 0.5
+DEVICE_INTERVAL = 0.5
+MAX_BACKOFF = 30.0
+MAX_CONNECTIONS = 200
+MAX_ID_BYTES = 16  # device ids are stored in fixed-width fields (binlog.RECORD)
+
+
+def check_device_id(device_id):
+    """Return `device_id` as a str, or raise ValueError if it does not fit a MAX_ID_BYTES field"""
+    device_id = str(device_id)
+    size = len(device_id.encode('utf-8'))
+    if not 0 < size <= MAX_ID_BYTES or '\0' in device_id:
+        raise ValueError(f"device id {device_id!r} must be 1-{MAX_ID_BYTES} bytes of UTF-8 without NUL")
+    return device_id
+
+
+class Device:
+    """One ESP32 sensor node from the device registry"""
+
+    def __init__(self, id, url, lat=None, lon=None, timeout=DEVICE_TIMEOUT, interval=DEVICE_INTERVAL):
+        self.id = check_device_id(id)
+        self.url = url
+        self.lat = lat
+        self.lon = lon
+        self.timeout = timeout
+        self.interval = interval
+
+    def __repr__(self):
+        return f"Device({self.id!r}, {self.url!r})"
+
+
+class DeviceStats:
+    """Per-device latency and error counters"""
+
+    def __init__(self):
+        self.polls = 0
+        self.errors = 0
+        self.failures = 0  # consecutive
+        self.last_latency = None
+        self.avg_latency = None
+        self.last_error = ""
+        self.last_ok = None
+
+    def ok(self, latency):
+        self.polls += 1
+        self.failures = 0
+        self.last_latency = latency
+        # Exponential moving average keeps this O(1)
+        self.avg_latency = latency if self.avg_latency is None else 0.9 * self.avg_latency + 0.1 * latency
+        self.last_ok = time.time()
+
+    def fail(self, error):
+        self.polls += 1
+        self.errors += 1
+        self.failures += 1
+        self.last_error = str(error)
+
+    def as_dict(self):
+        return {
+            'polls': self.polls,
+            'errors': self.errors,
+            'failures': self.failures,
+            'latency_ms': None if self.last_latency is None else round(self.last_latency * 1000, 1),
+            'avg_latency_ms': None if self.avg_latency is None else round(self.avg_latency * 1000, 1),
+            'last_error': self.last_error,
+        }
+
+
+def parse_reading(data):
+    """Decode the ESP JSON payload into typed sensor values"""
+    return int(data['co']), int(data['gas']), float(data['temp'])
+
+
+def load_devices(path, default_url=None):
+    """Read the device registry (a JSON list); fall back to a single device"""
+    if os.path.isfile(path):
+        with open(path) as f:
+            entries = json.load(f)
+        return [Device(**entry) for entry in entries]
+    if default_url:
+        return [Device("esp-1", default_url)]
+    return []
+
+
+class FleetPoller:
+    """Polls every device concurrently over one pooled keep-alive session.
+
+    `on_reading(device, data)` is called with the decoded JSON of each
+    successful poll. Failing devices back off exponentially up to
+    MAX_BACKOFF seconds without slowing down the others. An exception from
+    `on_reading` is counted in `handler_errors`, not against the device.
+    """
+
+    def __init__(self, devices, on_reading, max_connections=MAX_CONNECTIONS):
+        self.devices = list(devices)
+        self.on_reading = on_reading
+        self.max_connections = max_connections
+        self.stats = {d.id: DeviceStats() for d in self.devices}
+        self.handler_errors = 0
+        self.last_handler_error = ""
+
+    def set_urls(self, urls):
+        """Point devices at new endpoints; each poll loop uses the new URL from its next request"""
+        for device in self.devices:
+            if device.id in urls:
+                device.url = urls[device.id]
+
+    async def run(self, stop):
+        """Poll until the threading.Event `stop` is set"""
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(self._poll_device(session, d, stop) for d in self.devices))
+
+    async def _poll_device(self, session, device, stop):
+        stats = self.stats[device.id]
+        timeout = aiohttp.ClientTimeout(total=device.timeout)
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            started = loop.time()
+            try:
+                async with session.get(device.url, timeout=timeout) as response:
+                    if response.status != 200:
+                        raise IOError(f"HTTP {response.status}")
+                    data = await response.json(content_type=None)
+                stats.ok(loop.time() - started)
+            except Exception as e:
+                stats.fail(str(e) or type(e).__name__)
+                # Cap the exponent: 2.0 ** ~1024 overflows and would end the whole poll loop
+                await asyncio.sleep(min(MAX_BACKOFF, device.interval * 2 ** min(stats.failures, 16)))
+                continue
+            try:
+                self.on_reading(device, data)
+            except Exception as e:
+                # A downstream bug must not look like a flapping sensor
+                self.handler_errors += 1
+                self.last_handler_error = f"{device.id}: {e!r}"
+            await asyncio.sleep(max(0.0, device.interval - (loop.time() - started)))
@@ -0,0 +1,65 @@
+# downsample.py
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURATION ---
+RAW_INTERVAL = 0.5             # nominal seconds between raw readings
+ROLLUPS = (1, 60, 3600)        # pre-computed bucket widths (seconds)
+MAX_POINTS = 1000              # roughly one bucket per horizontal pixel
+METRICS = ('co', 'gas', 'temp')
+
+
+def pick_resolution(span, max_points=MAX_POINTS):
+    """Data to read for `span` seconds: the coarsest rollup width that still gives at
+    least `max_points` buckets (rebucket() then merges them down), else 0 for raw rows"""
+    for width in reversed(ROLLUPS):
+        if span / width >= max_points:
+            return width
+    return 0
+
+
+def rebucket(df, max_points=MAX_POINTS, metrics=METRICS):
+    """Merge rows into at most `max_points` equal-time buckets keeping min/max/mean.
+
+    `df` has a `ts` column plus `<m>`, `<m>_min`, `<m>_max` and `n` columns
+    (raw rows count as n=1 with min == max == value).
+    """
+    if len(df) <= max_points:
+        return df
+    ts = df['ts'].to_numpy()
+    width = (ts[-1] - ts[0]) / max_points or 1.0
+    bucket = np.minimum(((ts - ts[0]) // width).astype(np.int64), max_points - 1)
+    weighted = df.assign(**{f'{m}_sum': df[m] * df['n'] for m in metrics}, _bucket=bucket)
+    agg = {'ts': 'first', 'n': 'sum'}
+    for m in metrics:
+        agg.update({f'{m}_sum': 'sum', f'{m}_min': 'min', f'{m}_max': 'max'})
+    out = weighted.groupby('_bucket', sort=True).agg(agg).reset_index(drop=True)
+    for m in metrics:
+        out[m] = out.pop(f'{m}_sum') / out['n']
+    return out
+
+
+def as_series(df, metrics=METRICS):
+    """Give raw rows the same shape as rollup rows (n, <m>_min, <m>_max)"""
+    df = df.assign(n=1)
+    for m in metrics:
+        df[f'{m}_min'] = df[m]
+        df[f'{m}_max'] = df[m]
+    return df
+
+
+def local_times(ts):
+    """Epoch seconds -> naive local datetimes, as datetime.fromtimestamp gives (vectorized)"""
+    ts = np.asarray(ts, dtype=float)
+    # UTC offsets only change on DST transitions; look them up once per quarter hour
+    quarters, index = np.unique(np.floor(ts / 900), return_inverse=True)
+    offsets = np.array([datetime.fromtimestamp(q * 900).astimezone().utcoffset().total_seconds() for q in quarters])
+    return pd.to_datetime(ts + offsets[index].reshape(ts.shape) if len(ts) else ts, unit='s')
+
+
+def with_time(df):
+    """Add a local datetime column for plotting"""
+    df['time'] = local_times(df['ts'])
+    return df
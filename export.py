@@ -0,0 +1,253 @@
+# export.py
+"""Streaming export of readings and alerts to CSV, gzip CSV or Parquet.
+
+    python export.py readings -o readings.csv.gz                       # the whole retained log
+    python export.py readings --start 2024-05-01 --end 2024-05-02 --devices esp-1,esp-2 -o may1.parquet
+    python export.py alerts --level DANGER -o danger.csv
+
+Rows are read and written CHUNK_ROWS at a time, so memory stays flat
+however long the range is: at most one chunk plus, for readings, the log
+segment it comes from (gzipped segments are inflated whole, 64 MB at most).
+The dashboard streams the same exports over HTTP from the ingest server
+(see export_routes), so nothing is built in the Streamlit process either.
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+from aiohttp import web
+
+from alerts import ALERTS_PATH, AlertStore
+from downsample import local_times
+from resources import peak_memory_mb
+from retention import LOG_DIR, SegmentLog
+
+# --- CONFIGURATION ---
+CHUNK_ROWS = 100000
+FORMATS = {  # name -> (content type, file suffix)
+    'csv': ('text/csv', '.csv'),
+    'csv.gz': ('application/gzip', '.csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+READING_COLUMNS = ('lat', 'lon', 'co', 'gas', 'temp')
+# Columns of each export and their types; an empty range still gets this header / schema
+FIELDS = {
+    'readings': [('time', 'timestamp'), ('ts', 'float'), ('device', 'string'),
+                 *((c, 'float') for c in READING_COLUMNS)],
+    'alerts': [('time', 'timestamp'), ('last', 'timestamp'), ('id', 'int'), ('device_id', 'string'),
+               ('metric', 'string'), ('kind', 'string'), ('level', 'string'), ('value', 'float'),
+               ('limit_value', 'float'), ('repeats', 'int')],
+}
+
+
+def reading_chunks(log, start=None, end=None, devices=None, chunk_rows=CHUNK_ROWS):
+    """DataFrames of (time, ts, device, lat, lon, co, gas, temp) from the segment log, oldest segment first.
+
+    `time` is naive local time, like the alert export and --start/--end.
+    """
+    for records in log.read(start, end, devices):
+        for i in range(0, len(records), chunk_rows):
+            part = records[i:i + chunk_rows]
+            df = pd.DataFrame({'ts': part['ts']})
+            df.insert(0, 'time', local_times(part['ts']))
+            df['device'] = part['device'].astype(str)
+            for column in READING_COLUMNS:
+                df[column] = part[column]
+            yield df
+
+
+def alert_chunks(store, start=None, end=None, devices=None, kind=None, level=None, chunk_rows=CHUNK_ROWS):
+    """DataFrames of alert rows, oldest first"""
+    yield from store.iter_query(start, end, devices, kind, level, chunksize=chunk_rows)
+
+
+class _Spool:
+    """Write-only file object whose bytes are taken out after every chunk"""
+
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos  # total written so far, as Parquet needs for its offsets
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class _CsvWriter:
+    def __init__(self, out, fields, compress):
+        self.out = out
+        self.names = [name for name, _ in fields]
+        self.f = gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6) if compress else out
+        self.f.write((','.join(self.names) + '\n').encode())
+
+    def write(self, df):
+        self.f.write(df[self.names].to_csv(index=False, header=False).encode())
+
+    def close(self):
+        if self.f is not self.out:
+            self.f.close()  # writes the gzip trailer; leaves `out` open
+
+
+class _ParquetWriter:
+    def __init__(self, out, fields):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+        types = {'timestamp': pa.timestamp('ns'), 'float': pa.float64(), 'int': pa.int64(), 'string': pa.string()}
+        self.pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in fields])
+        self.writer = pq.ParquetWriter(out, self.schema, compression='zstd')
+
+    def write(self, df):
+        if not len(df):
+            return  # the schema is already written; empty frames may lack the column types
+        table = self.pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)  # one row group per chunk
+
+    def close(self):
+        self.writer.close()
+
+
+def _writer(out, fmt, fields):
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == 'parquet':
+        return _ParquetWriter(out, fields)
+    return _CsvWriter(out, fields, compress=fmt == 'csv.gz')
+
+
+def write_export(chunks, out, fmt, fields):
+    """Write DataFrame chunks with the columns `fields` (see FIELDS) to the binary file
+    object `out`; returns the number of rows"""
+    writer = _writer(out, fmt, fields)
+    rows = 0
+    for df in chunks:
+        writer.write(df)
+        rows += len(df)
+    writer.close()
+    return rows
+
+
+def iter_export(chunks, fmt, fields):
+    """Yield the encoded export piece by piece, one piece per chunk (for streaming responses)"""
+    spool = _Spool()
+    writer = _writer(spool, fmt, fields)
+    for df in chunks:
+        writer.write(df)
+        data = spool.take()
+        if data:
+            yield data
+    writer.close()
+    yield spool.take()
+
+
+def parse_time(value):
+    """Epoch seconds or an ISO date/time (local time) -> epoch seconds; None passes through"""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def export_routes(log, alerts):
+    """aiohttp routes streaming exports at /export/readings and /export/alerts.
+
+    Query parameters: start, end (epoch s or ISO), devices (comma separated),
+    format (csv, csv.gz, parquet) and, for alerts, kind and level.
+    """
+    async def handler(request):
+        kind = request.match_info['kind']
+        q = request.query
+        fmt = q.get('format', 'csv')
+        if fmt not in FORMATS:
+            raise web.HTTPBadRequest(text=f"format must be one of {', '.join(FORMATS)}")
+        try:
+            start, end = parse_time(q.get('start')), parse_time(q.get('end'))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        devices = [d for d in q.get('devices', '').split(',') if d] or None
+        if kind == 'readings':
+            chunks = reading_chunks(log, start, end, devices)
+        elif kind == 'alerts':
+            chunks = alert_chunks(alerts, start, end, devices, q.get('kind') or None, q.get('level') or None)
+        else:
+            raise web.HTTPNotFound()
+        content_type, suffix = FORMATS[fmt]
+        name = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}"
+        response = web.StreamResponse(headers={'Content-Type': content_type,
+                                               'Content-Disposition': f'attachment; filename="{name}"'})
+        await response.prepare(request)
+        # Reading and encoding are blocking; run each piece off the ingest event loop
+        loop = asyncio.get_running_loop()
+        pieces = iter_export(chunks, fmt, FIELDS[kind])
+        while True:
+            data = await loop.run_in_executor(None, next, pieces, None)
+            if data is None:
+                break
+            await response.write(data)
+        await response.write_eof()
+        return response
+
+    return [('GET', '/export/{kind}', handler)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export readings or alerts")
+    parser.add_argument('kind', choices=['readings', 'alerts'])
+    parser.add_argument('-o', '--out', required=True, help="output file; the format follows its suffix unless --format is given")
+    parser.add_argument('--format', choices=list(FORMATS))
+    parser.add_argument('--start', help="epoch seconds or ISO date/time")
+    parser.add_argument('--end', help="epoch seconds or ISO date/time (exclusive)")
+    parser.add_argument('--devices', help="comma separated device ids")
+    parser.add_argument('--kind', dest='alert_kind', help="alerts only: prediction, threshold, rate or anomaly")
+    parser.add_argument('--level', help="alerts only: WARNING or DANGER")
+    parser.add_argument('--log-dir', default=LOG_DIR)
+    parser.add_argument('--alerts', default=ALERTS_PATH)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    fmt = args.format or next((f for f, (_, suffix) in sorted(FORMATS.items(), key=lambda kv: -len(kv[1][1]))
+                               if args.out.endswith(suffix)), 'csv')
+    start, end = parse_time(args.start), parse_time(args.end)
+    devices = args.devices.split(',') if args.devices else None
+    if args.kind == 'readings':
+        chunks = reading_chunks(SegmentLog(args.log_dir), start, end, devices, args.chunk_rows)
+    else:
+        chunks = alert_chunks(AlertStore(args.alerts), start, end, devices, args.alert_kind, args.level, args.chunk_rows)
+
+    started = time.perf_counter()
+    tmp = args.out + '.tmp'
+    with open(tmp, 'wb') as f:
+        rows = write_export(chunks, f, fmt, FIELDS[args.kind])
+    os.replace(tmp, args.out)
+    print(f"✅ Exported {rows} {args.kind} to {args.out} ({fmt}, {os.path.getsize(args.out) / 1024 ** 2:.1f} MB) "
+          f"in {time.perf_counter() - started:.1f}s, peak memory {peak_memory_mb():.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# fake_sensor.py
+"""Load generator for the push ingest server.
+
+    python fake_sensor.py --mode http --rate 5000 --devices 50
+    python fake_sensor.py --mode udp --rate 20000 --duration 30
+"""
+import argparse
+import asyncio
+import socket
+import time
+
+import aiohttp
+import numpy as np
+
+
+class FakeFleet:
+    """Random-walk co/gas/temp values for a set of fake devices"""
+
+    def __init__(self, n_devices, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.ids = [f"fake-{i}" for i in range(n_devices)]
+        self.co = self.rng.uniform(10, 100, n_devices)
+        self.gas = self.rng.uniform(200, 800, n_devices)
+        self.temp = self.rng.uniform(25, 32, n_devices)
+
+    def batch(self, size):
+        """`size` readings spread round-robin over the devices"""
+        n = len(self.ids)
+        self.co = np.clip(self.co + self.rng.normal(0, 2, n), 0, 500)
+        self.gas = np.clip(self.gas + self.rng.normal(0, 10, n), 0, 2000)
+        self.temp = np.clip(self.temp + self.rng.normal(0, 0.1, n), 15, 60)
+        now = time.time()
+        idx = np.arange(size) % n
+        return [{
+            'device': self.ids[i],
+            'ts': now,
+            'co': int(self.co[i]),
+            'gas': int(self.gas[i]),
+            'temp': round(float(self.temp[i]), 2),
+        } for i in idx]
+
+
+async def run_http(fleet, url, rate, batch_size, duration):
+    sent = 0
+    interval = batch_size / rate
+    deadline = time.monotonic() + duration
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            async with session.post(url, json=fleet.batch(batch_size)) as response:
+                result = await response.json()
+            sent += result.get('accepted', 0)
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+    return sent
+
+
+def run_udp(fleet, host, port, rate, batch_size, duration):
+    sent = 0
+    interval = batch_size / rate
+    deadline = time.monotonic() + duration
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        lines = [f"{r['device']},{r['ts']},{r['co']},{r['gas']},{r['temp']}" for r in fleet.batch(batch_size)]
+        # Keep datagrams comfortably under the typical 64 KB limit
+        for i in range(0, len(lines), 500):
+            sock.sendto("\n".join(lines[i:i + 500]).encode(), (host, port))
+        sent += len(lines)
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream fake sensor readings to the ingest server")
+    parser.add_argument('--mode', choices=['http', 'udp'], default='http')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--http-port', type=int, default=8600)
+    parser.add_argument('--udp-port', type=int, default=8601)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=1000, help="readings per second")
+    parser.add_argument('--batch', type=int, default=100, help="readings per request/tick")
+    parser.add_argument('--duration', type=float, default=10, help="seconds")
+    args = parser.parse_args()
+
+    fleet = FakeFleet(args.devices)
+    started = time.monotonic()
+    if args.mode == 'http':
+        url = f"http://{args.host}:{args.http_port}/ingest"
+        sent = asyncio.run(run_http(fleet, url, args.rate, args.batch, args.duration))
+    else:
+        sent = run_udp(fleet, args.host, args.udp_port, args.rate, args.batch, args.duration)
+    elapsed = time.monotonic() - started
+    print(f"Sent {sent} readings in {elapsed:.1f}s ({sent / elapsed:.0f}/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# forecast.py
+"""Lagged / rolling-window features for the next-10-second forecaster.
+
+Training and live inference share series_features(), so a model always sees
+the same features it was trained on. Readings are first averaged into STEP
+second buckets (the 1 s rollup in the store), which gives every device a
+regular series regardless of its sample rate.
+"""
+import numpy as np
+import pandas as pd
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
+
+# --- CONFIGURATION ---
+METRICS = ('gas', 'co', 'temp')   # model input and output order
+STEP = 1                          # seconds per series step (a rollup width)
+HORIZON = 10                      # steps ahead the model forecasts
+LAGS = (1, 5, 10, 30)
+WINDOWS = (10, 60)                # rolling mean / std widths; min / max use the widest
+HISTORY = max(max(LAGS) + 1, max(WINDOWS))  # steps a feature row needs
+MAX_GAP = 5                       # missing steps bridged by repeating the last value
+
+
+def feature_names():
+    names = list(METRICS)
+    names += [f'{m}_lag{lag}' for lag in LAGS for m in METRICS]
+    for w in WINDOWS:
+        names += [f'{m}_mean{w}' for m in METRICS] + [f'{m}_std{w}' for m in METRICS]
+    w = max(WINDOWS)
+    names += [f'{m}_min{w}' for m in METRICS] + [f'{m}_max{w}' for m in METRICS]
+    names += [f'{m}_delta{HORIZON}' for m in METRICS]
+    return names
+
+
+N_FEATURES = len(feature_names())
+
+
+def series_features(x):
+    """(..., T, 3) regular series -> (..., T, N_FEATURES) feature rows.
+
+    Row t only looks at steps <= t; the first HISTORY - 1 rows are partly
+    NaN. Rolling sums come from cumulative sums and min/max from scipy's
+    running filters, so the cost is linear in T and nothing loops in Python.
+    """
+    x = np.asarray(x, dtype=float)
+    cols = [x]
+    cols += [_shift(x, lag) for lag in LAGS]
+    # Offsetting by the first value keeps the cumulative sums small and exact
+    base = x[..., :1, :]
+    c1 = _cumsum0(x - base)
+    c2 = _cumsum0((x - base) ** 2)
+    for w in WINDOWS:
+        s1 = _pad(c1[..., w:, :] - c1[..., :-w, :], w)
+        s2 = _pad(c2[..., w:, :] - c2[..., :-w, :], w)
+        mean = s1 / w
+        cols += [mean + base, np.sqrt(np.maximum(s2 / w - mean ** 2, 0.0))]
+    w = max(WINDOWS)
+    # Trailing windows: shift the centred filter so row t covers t - w + 1 .. t
+    lo = minimum_filter1d(x, w, axis=-2, origin=(w - 1) // 2)
+    hi = maximum_filter1d(x, w, axis=-2, origin=(w - 1) // 2)
+    lo[..., :w - 1, :] = np.nan
+    hi[..., :w - 1, :] = np.nan
+    cols += [lo, hi]
+    cols.append(x - _shift(x, HORIZON))
+    return np.concatenate(cols, axis=-1)
+
+
+def _shift(x, lag):
+    out = np.full_like(x, np.nan)
+    out[..., lag:, :] = x[..., :-lag, :]
+    return out
+
+
+def _cumsum0(x):
+    zero = np.zeros_like(x[..., :1, :])
+    return np.concatenate([zero, np.cumsum(x, axis=-2)], axis=-2)
+
+
+def _pad(x, w):
+    """Left-pad a rolling result of length T - w + 1 back to T with NaN"""
+    pad = np.full(x.shape[:-2] + (w - 1, x.shape[-1]), np.nan)
+    return np.concatenate([pad, x], axis=-2)
+
+
+def regular_segments(ts, values, step=STEP, max_gap=MAX_GAP):
+    """Split one device's (ts, (n, 3) values) into gap-free regular series.
+
+    Yields (start_ts, (T, 3) array) per segment; missing steps up to
+    `max_gap` long are filled with the previous value, longer gaps start a
+    new segment.
+    """
+    ts = np.asarray(ts, dtype=float)
+    if len(ts) == 0:
+        return
+    order = np.argsort(ts, kind='stable')
+    ts, values = ts[order], np.asarray(values, dtype=float)[order]
+    idx = np.round((ts - ts[0]) / step).astype(np.int64)
+    breaks = np.nonzero(np.diff(idx) > max_gap + 1)[0] + 1
+    for seg_idx, seg_values in zip(np.split(idx, breaks), np.split(values, breaks)):
+        grid = np.full((seg_idx[-1] - seg_idx[0] + 1, values.shape[1]), np.nan)
+        grid[seg_idx - seg_idx[0]] = seg_values
+        grid = pd.DataFrame(grid).ffill().to_numpy()
+        yield ts[0] + seg_idx[0] * step, grid
+
+
+def training_rows(series, start_ts=0.0, step=STEP, horizon=HORIZON):
+    """(T, 3) regular series starting at `start_ts` -> (ts, X, Y) with Y the values `horizon` steps after each row"""
+    features = series_features(series)[:len(series) - horizon]
+    target = series[horizon:]
+    ok = np.isfinite(features).all(axis=1) & np.isfinite(target).all(axis=1)
+    ts = start_ts + np.arange(len(features)) * step
+    return ts[ok], features[ok].astype(np.float32), target[ok]
+
+
+class SeriesStream:
+    """Turns time-ordered chunks of bucket means from many devices into training rows.
+
+    Each device keeps only the last HISTORY + HORIZON buckets between
+    chunks, enough to finish the rows whose target was not known yet, so
+    memory is bounded by the chunk size however long the history is.
+    """
+
+    def __init__(self, step=STEP, max_gap=MAX_GAP, horizon=HORIZON):
+        self.step = step
+        self.max_gap = max_gap
+        self.horizon = horizon
+        self.keep = HISTORY + horizon
+        self.tails = {}     # device -> (ts, values) of its last buckets
+        self.emitted = {}   # device -> ts of the last row already produced
+
+    def feed(self, ts, devices, values):
+        """Yield (ts, X, Y) blocks for one chunk of (ts, device, (n, 3) values) rows"""
+        ts = np.asarray(ts, dtype=float)
+        devices = np.asarray(devices)
+        values = np.asarray(values, dtype=float)
+        for device in np.unique(devices):
+            mine = devices == device
+            dev_ts, dev_values = ts[mine], values[mine]
+            if device in self.tails:
+                tail_ts, tail_values = self.tails[device]
+                dev_ts = np.concatenate([tail_ts, dev_ts])
+                dev_values = np.concatenate([tail_values, dev_values])
+            self.tails[device] = (dev_ts[-self.keep:], dev_values[-self.keep:])
+            done = self.emitted.get(device, -np.inf)
+            for start, series in regular_segments(dev_ts, dev_values, self.step, self.max_gap):
+                row_ts, X, Y = training_rows(series, start, self.step, self.horizon)
+                new = row_ts > done
+                if new.any():
+                    self.emitted[device] = row_ts[new][-1]
+                    yield row_ts[new], X[new], Y[new]
+
+
+class FeatureWindow:
+    """Per-device trailing series of STEP-second means, updated reading by reading.
+
+    add() folds readings into each device's current bucket and returns one
+    feature row per reading, computed over the closed buckets plus the
+    current partial one. A device without enough history yet is padded with
+    its oldest value, so it looks like a steady signal rather than NaN.
+    """
+
+    def __init__(self, history=HISTORY, step=STEP, max_gap=MAX_GAP):
+        self.history = history
+        self.step = step
+        self.max_gap = max_gap
+        self.devices = {}
+
+    def add(self, readings):
+        """Reading dicts (device, time, gas, co, temp) -> (n, N_FEATURES) float32 features"""
+        return self.add_arrays([r['device'] for r in readings], [r['time'].timestamp() for r in readings],
+                               [[r[m] for m in METRICS] for r in readings])
+
+    def add_arrays(self, devices, ts, values):
+        """Device ids, epoch seconds and (n, 3) values, e.g. columns of a ring.ReadingRing window"""
+        values = np.asarray(values, dtype=float).reshape(len(ts), len(METRICS))
+        windows = np.empty((len(ts), self.history, len(METRICS)))
+        for i, (device, t) in enumerate(zip(devices, ts)):
+            state = self._update(device, float(t), values[i])
+            windows[i, :-1] = state['closed']
+            windows[i, -1] = state['sum'] / state['n']
+        _backfill(windows)
+        return series_features(windows)[:, -1].astype(np.float32)
+
+    def _update(self, device, ts, values):
+        bucket = int(ts // self.step)
+        state = self.devices.get(device)
+        if state is None:
+            state = {'bucket': bucket, 'sum': np.zeros(len(METRICS)), 'n': 0,
+                     'closed': np.full((self.history - 1, len(METRICS)), np.nan)}
+            self.devices[device] = state
+        elif bucket > state['bucket']:
+            closed = state['closed']
+            mean = state['sum'] / state['n']
+            gap = bucket - state['bucket'] - 1
+            if gap > self.max_gap:
+                closed[:] = np.nan  # too long a gap: start over, like a new training segment
+                closed[-1] = mean
+            else:
+                shift = min(gap + 1, len(closed))
+                closed[:-shift] = closed[shift:]
+                closed[-shift:] = mean  # the closed bucket, repeated over any short gap
+            state['bucket'] = bucket
+            state['sum'] = np.zeros(len(METRICS))
+            state['n'] = 0
+        # Late readings for an already closed bucket count towards the current one
+        state['sum'] += values
+        state['n'] += 1
+        return state
+
+
+class ResidualForecaster:
+    """A regressor trained on the change over the horizon, predicting levels.
+
+    Trees cannot extrapolate beyond the values they were trained on, so
+    the model learns next - current and the current readings (the first
+    len(METRICS) features) are added back.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.base_features = list(range(len(METRICS)))
+        self.n_features_in_ = model.n_features_in_
+        self.trained_until = None  # ts of the newest training row, for warm-start updates
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return X[:, self.base_features] + np.asarray(self.model.predict(X)).reshape(len(X), -1)
+
+
+def _backfill(windows):
+    """Fill leading NaN steps of each (history, 3) window with its first real value"""
+    missing = np.isnan(windows[:, :, 0])
+    if not missing.any():
+        return
+    first = np.argmin(missing, axis=1)
+    fill = windows[np.arange(len(windows)), first]
+    windows[missing] = np.broadcast_to(fill[:, None, :], windows.shape)[missing]
@@ -0,0 +1,166 @@
+# forest.py
+"""Compact array representation of the random-forest models.
+
+    python forest.py export src/hazard_model.pkl                    # -> src/hazard_forest/
+    python forest.py export src/methane_model.pkl src/co_model.pkl src/temp_model.pkl
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+# --- CONFIGURATION ---
+FOREST_DIR = os.path.join('src', 'hazard_forest')
+FORMAT_VERSION = 1
+ARRAYS = ('left', 'right', 'feature', 'threshold', 'value', 'roots')
+
+
+def export_forest(forests, out_dir=FOREST_DIR, base_features=()):
+    """Flatten fitted sklearn forests into node arrays saved as .npy files.
+
+    `forests` is one multi-output forest, or a list of single-output forests
+    (one per target, in target order). All trees share one set of node
+    arrays; leaves point to themselves so evaluation can run a fixed number
+    of steps, and leaf values are pre-divided by the tree count so a
+    prediction is a plain sum over trees.
+
+    `base_features` (one per output) are input columns added to the sum, for
+    forests trained on a change rather than a level (see ResidualForecaster).
+    """
+    if not isinstance(forests, (list, tuple)):
+        forests = [forests]
+    n_outputs = sum(f.n_outputs_ for f in forests)
+    n_features = forests[0].n_features_in_
+
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    first_output = 0
+    for forest in forests:
+        n_trees = len(forest.estimators_)
+        for est in forest.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left < 0
+            own = np.arange(n)
+            left.append(np.where(is_leaf, own, tree.children_left) + offset)
+            right.append(np.where(is_leaf, own, tree.children_right) + offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            leaf_value = np.zeros((n, n_outputs))
+            leaf_value[:, first_output:first_output + forest.n_outputs_] = tree.value[:, :, 0] / n_trees
+            value.append(np.where(is_leaf[:, None], leaf_value, 0.0))
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+        first_output += forest.n_outputs_
+
+    arrays = {
+        'left': np.concatenate(left).astype(np.int32),
+        'right': np.concatenate(right).astype(np.int32),
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'value': np.concatenate(value).astype(np.float64),
+        'roots': np.array(roots, dtype=np.int32),
+    }
+    # Write next to the target and swap directories so a running dashboard
+    # never memory-maps a half-written export
+    tmp_dir = out_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), arr)
+    meta = {
+        'version': FORMAT_VERSION,
+        'n_features': int(n_features),
+        'n_outputs': int(n_outputs),
+        'n_trees': len(roots),
+        'n_nodes': int(offset),
+        'max_depth': int(max_depth),
+        'base_features': [int(i) for i in base_features],
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    old_dir = out_dir.rstrip(os.sep) + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+class CompactForest:
+    """Evaluates an exported forest with NumPy over memory-mapped node arrays.
+
+    All rows walk all trees together: every step is one gather per array
+    over a (rows, trees) matrix of node indices, repeated max_depth times.
+    """
+
+    def __init__(self, path=FOREST_DIR, mmap=True):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported forest format version {self.meta['version']}")
+        mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode))
+        self.max_depth = self.meta['max_depth']
+        self.n_features_in_ = self.meta['n_features']  # same name as on sklearn estimators
+        self.base_features = self.meta.get('base_features', [])
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        # sklearn compares float32 features against float64 thresholds
+        X32 = X.astype(np.float32)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X32[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        out = self.value[node].sum(axis=1)
+        if self.base_features:
+            out += X[:, self.base_features]
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export pickled forests to the compact array format")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help="convert one multi-output or several per-target .pkl models")
+    export.add_argument('models', nargs='+')
+    export.add_argument('--out', default=FOREST_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        import joblib
+        models = [joblib.load(p) for p in args.models]
+        # A ResidualForecaster exports its inner forest plus the columns it adds back
+        forests = [getattr(m, 'model', m) for m in models]
+        base = getattr(models[0], 'base_features', ())
+        meta = export_forest(forests if len(forests) > 1 else forests[0], args.out, base)
+        print(f"✅ Exported {meta['n_trees']} trees / {meta['n_nodes']} nodes to {args.out}")
+
+        compact = CompactForest(args.out)
+        rng = np.random.default_rng(0)
+        X = rng.uniform([100, 10, 20], [2000, 500, 50], (1000, 3))
+        if compact.n_features_in_ != X.shape[1]:
+            # Sequence model: feature rows of a random walk through the same ranges
+            from forecast import HISTORY, series_features
+            walk = np.cumsum(rng.normal(0, [20, 5, 0.1], (1000 + HISTORY, 3)), axis=0) + X.mean(axis=0)
+            X = series_features(walk)[HISTORY:]
+        expected = np.column_stack([np.asarray(m.predict(X)).reshape(len(X), -1) for m in models])
+        print(f"Max abs difference vs. sklearn: {np.abs(compact.predict(X) - expected).max():.2e}")
+        started = time.perf_counter()
+        for row in X[:1000]:
+            compact.predict(row)
+        print(f"Single-row predict: {(time.perf_counter() - started) * 1000:.0f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# gauges.py
+import plotly.graph_objects as go
+
+
+def gauge_status(value, safe_threshold, warning_threshold):
+    """(status, bar colour) for a reading"""
+    if value <= safe_threshold:
+        return "SAFE", "green"
+    elif value <= warning_threshold:
+        return "WARNING", "orange"
+    else:
+        return "DANGER", "red"
+
+
+def create_gauge(value, title, max_val, safe_threshold, warning_threshold):
+    """Create a gauge chart using Plotly"""
+    status, color = gauge_status(value, safe_threshold, warning_threshold)
+
+    fig = go.Figure(data=[go.Indicator(
+        mode="gauge+number+delta",
+        value=value,
+        title={'text': f"{title}<br><sub>{status}</sub>"},
+        delta={'reference': safe_threshold},
+        gauge={
+            'axis': {'range': [0, max_val]},
+            'bar': {'color': color},
+            'steps': [
+                {'range': [0, safe_threshold], 'color': "#27AE60"},
+                {'range': [safe_threshold, warning_threshold], 'color': "#E67E22"},
+                {'range': [warning_threshold, max_val], 'color': "#E74C3C"}
+            ],
+            'threshold': {
+                'line': {'color': "red", 'width': 2},
+                'thickness': 0.75,
+                'value': warning_threshold
+            }
+        }
+    )])
+    # template='none' drops plotly's ~6 KB default template from every payload;
+    # all the styling the gauge needs is set explicitly here
+    fig.update_layout(margin=dict(l=20, r=20, t=60, b=20), height=300, paper_bgcolor="#1A1A2E", plot_bgcolor="#0F0F1E",
+                      font=dict(color="#F0F0F0", size=12), template='none')
+    return fig
+
+
+class LiveGauge:
+    """A gauge whose figure is built once and patched on each reading.
+
+    show() only touches the indicator's value, status text and bar colour,
+    and skips sending the chart at all when the value has not changed.
+    """
+
+    def __init__(self, title, max_val, safe_threshold, warning_threshold):
+        self.title = title
+        self.max_val = max_val
+        self.safe = safe_threshold
+        self.warning = warning_threshold
+        self.fig = create_gauge(0, title, max_val, safe_threshold, warning_threshold)
+        self.placeholder = None
+        self.shown = None
+
+    def set_thresholds(self, safe_threshold, warning_threshold):
+        """Move the coloured bands; the next show() redraws even if the value is unchanged"""
+        if (safe_threshold, warning_threshold) == (self.safe, self.warning):
+            return
+        self.safe = safe_threshold
+        self.warning = warning_threshold
+        gauge = self.fig.data[0].gauge
+        gauge.steps = [
+            {'range': [0, safe_threshold], 'color': "#27AE60"},
+            {'range': [safe_threshold, warning_threshold], 'color': "#E67E22"},
+            {'range': [warning_threshold, self.max_val], 'color': "#E74C3C"}
+        ]
+        gauge.threshold.value = warning_threshold
+        self.fig.data[0].delta.reference = safe_threshold
+        self.shown = None
+
+    def attach(self, placeholder):
+        """Bind to this script run's st.empty() slot; the next show() always draws"""
+        self.placeholder = placeholder
+        self.shown = None
+
+    def show(self, value):
+        if value == self.shown or self.placeholder is None:
+            return False
+        status, color = gauge_status(value, self.safe, self.warning)
+        indicator = self.fig.data[0]
+        indicator.value = value
+        indicator.title.text = f"{self.title}<br><sub>{status}</sub>"
+        indicator.gauge.bar.color = color
+        self.placeholder.plotly_chart(self.fig, use_container_width=True)
+        self.shown = value
+        return True
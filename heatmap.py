@@ -0,0 +1,192 @@
+# heatmap.py
+import asyncio
+import math
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+from aiohttp import web
+
+from ring import COL
+from spatial import METRICS, SpatialGrid, level_for_zoom
+
+# --- CONFIGURATION ---
+TILE_SIZE = 256
+RADIUS = 25            # px, same look as the old folium HeatMap(radius=25)
+BLUR = 15              # px, gaussian sigma-ish
+MIN_OPACITY = 0.2
+CACHE_TILES = 2048
+MAX_ZOOM = 24          # tiles are refused beyond this zoom
+GRADIENT = [(0.0, '#27AE60'), (0.5, '#E67E22'), (1.0, '#E74C3C')]
+# Reading value that maps to full intensity for each layer
+LAYERS = {'gas': 2000.0, 'co': 500.0, 'temp': 60.0}
+
+
+def project(lat, lon, zoom):
+    """Web Mercator global pixel coordinates at `zoom`"""
+    scale = TILE_SIZE * 2 ** zoom
+    lat = np.clip(np.asarray(lat, dtype=float), -85.0511, 85.0511)
+    x = (np.asarray(lon, dtype=float) + 180.0) / 360.0 * scale
+    s = np.sin(np.radians(lat))
+    y = (0.5 - np.log((1 + s) / (1 - s)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def tile_bounds(z, x, y, margin=0):
+    """(south, west, north, east) of a tile, optionally padded by `margin` pixels"""
+    scale = TILE_SIZE * 2 ** z
+
+    def lon(px):
+        return px / scale * 360.0 - 180.0
+
+    def lat(py):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * py / scale))))
+
+    x0, y0 = x * TILE_SIZE - margin, y * TILE_SIZE - margin
+    x1, y1 = (x + 1) * TILE_SIZE + margin, (y + 1) * TILE_SIZE + margin
+    return lat(y1), lon(x0), lat(y0), lon(x1)
+
+
+def encode_png(rgba):
+    """Minimal RGBA PNG encoder (zlib + struct, no imaging library needed)"""
+    h, w, _ = rgba.shape
+    raw = np.zeros((h, w * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(h, w * 4)  # filter byte 0 on every row
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', w, h, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+def _gradient_lut():
+    stops = [s for s, _ in GRADIENT]
+    rgb = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for _, c in GRADIENT], dtype=float)
+    v = np.linspace(0, 1, 256)
+    return np.stack([np.interp(v, stops, rgb[:, i]) for i in range(3)], axis=1).astype(np.uint8)
+
+
+def _blur_matrix(n):
+    """Banded matrix that applies a 1-D gaussian of peak 1 along an axis of length n"""
+    offsets = np.arange(n)[:, None] - np.arange(n)[None, :]
+    k = np.exp(-0.5 * (offsets / (BLUR / 1.5)) ** 2)
+    k[np.abs(offsets) > RADIUS] = 0.0
+    return k
+
+
+class HeatmapEngine:
+    """Rasterizes the spatial grid into cached XYZ PNG tiles.
+
+    Each tile draws the grid cells (max or mean per cell) in its viewport at
+    the level matching its zoom, so render cost stays constant however many
+    readings the grid has absorbed. New readings only evict the cached
+    tiles they can reach, so a browser refreshing its tile layer re-fetches
+    mostly cache hits and the Leaflet map itself is never rebuilt.
+    """
+
+    def __init__(self, grid=None):
+        self.grid = grid if grid is not None else SpatialGrid()
+        self.cache = OrderedDict()
+        self.lut = _gradient_lut()
+        self.kernel = _blur_matrix(TILE_SIZE + 2 * RADIUS)
+        self.version = 0
+        self.empty_png = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+        self._lock = threading.Lock()
+
+    def add_columns(self, devices, columns):
+        """IngestService column listener: fold an (n, len(ring.COLUMNS)) batch into the grid"""
+        lat, lon = columns[:, COL['lat']], columns[:, COL['lon']]
+        self.grid.add(lat, lon, columns[:, [COL[m] for m in METRICS]])
+        ok = np.isfinite(lat) & np.isfinite(lon)
+        if not ok.any():
+            return
+        with self._lock:
+            self.version += 1
+            self._invalidate(lat[ok], lon[ok])
+
+    def seed(self, chunks):
+        """Fold historical (lat, lon, gas/co/temp) chunks into the grid, e.g. from SensorStore"""
+        for lat, lon, values in chunks:
+            self.grid.add(lat, lon, values)
+        with self._lock:
+            self.version += 1
+            self.cache.clear()
+
+    def tile(self, layer, z, x, y, stat='max'):
+        """PNG bytes for one tile"""
+        key = (layer, stat, z, x, y)
+        with self._lock:
+            png = self.cache.get(key)
+            if png is not None:
+                self.cache.move_to_end(key)
+                return png
+            version = self.version
+        png = self._render(layer, stat, z, x, y)
+        with self._lock:
+            if version != self.version:
+                return png  # new readings arrived while rendering; don't cache a stale tile
+            self.cache[key] = png
+            while len(self.cache) > CACHE_TILES:
+                self.cache.popitem(last=False)
+        return png
+
+    def _invalidate(self, lat, lon):
+        zooms = {key[2] for key in self.cache}
+        for z in zooms:
+            px, py = project(lat, lon, z)
+            stale = set()
+            for dx in (-RADIUS, RADIUS):
+                for dy in (-RADIUS, RADIUS):
+                    stale.update(zip(((px + dx) // TILE_SIZE).astype(int), ((py + dy) // TILE_SIZE).astype(int)))
+            for key in [k for k in self.cache if k[2] == z and (k[3], k[4]) in stale]:
+                del self.cache[key]
+
+    def _render(self, layer, stat, z, x, y):
+        south, west, north, east = tile_bounds(z, x, y, margin=RADIUS)
+        lat, lon, values = self.grid.query(level_for_zoom(z), south, west, north, east, layer, stat)
+        if len(lat) == 0:
+            return self.empty_png
+
+        size = TILE_SIZE + 2 * RADIUS
+        px, py = project(lat, lon, z)
+        col = np.clip((px - x * TILE_SIZE + RADIUS).astype(int), 0, size - 1)
+        row = np.clip((py - y * TILE_SIZE + RADIUS).astype(int), 0, size - 1)
+        value = np.zeros((size, size))
+        occupied = np.zeros((size, size))
+        np.maximum.at(value, (row, col), np.clip(values / LAYERS[layer], 0.0, 1.0))
+        occupied[row, col] = 1.0
+
+        # Blurred value weighted by blurred occupancy: a smooth local average
+        # of cell values that does not saturate as readings pile up
+        density = (self.kernel @ occupied @ self.kernel.T)[RADIUS:-RADIUS, RADIUS:-RADIUS]
+        total = (self.kernel @ value @ self.kernel.T)[RADIUS:-RADIUS, RADIUS:-RADIUS]
+        heat = np.clip(total / np.maximum(density, 1e-9), 0.0, 1.0)
+        rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        rgba[..., :3] = self.lut[(heat * 255).astype(np.uint8)]
+        alpha = np.where(density > 0.05, MIN_OPACITY + (1 - MIN_OPACITY) * heat, 0.0)
+        rgba[..., 3] = (alpha * 255).astype(np.uint8)
+        return encode_png(rgba)
+
+
+def tile_routes(engine):
+    """aiohttp routes serving the engine's tiles at /tiles/{layer}/{z}/{x}/{y}.png[?stat=max|mean]"""
+    async def tile(request):
+        layer = request.match_info['layer']
+        if layer not in LAYERS:
+            raise web.HTTPNotFound()
+        stat = request.query.get('stat', 'max')
+        if stat not in ('max', 'mean'):
+            raise web.HTTPBadRequest(text="stat must be max or mean")
+        z, x, y = (int(request.match_info[k]) for k in ('z', 'x', 'y'))  # digits only, see the route
+        if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            raise web.HTTPNotFound()
+        # Rasterizing is CPU work; keep it off the ingest event loop
+        png = await asyncio.get_running_loop().run_in_executor(None, engine.tile, layer, z, x, y, stat)
+        return web.Response(body=png, content_type='image/png',
+                            headers={'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'})
+
+    return [('GET', r'/tiles/{layer}/{z:\d+}/{x:\d+}/{y:\d+}.png', tile)]
@@ -0,0 +1,231 @@
+# inference.py
+"""Micro-batched inference for the hazard models.
+
+    python inference.py   # throughput / latency of the current model
+"""
+import argparse
+import os
+import threading
+import time
+from collections import deque
+
+import joblib
+import numpy as np
+
+from forecast import HISTORY, METRICS, N_FEATURES, FeatureWindow, series_features
+from forest import FOREST_DIR, CompactForest
+from rules import LEVELS, threshold_levels
+
+# --- CONFIGURATION ---
+MODEL_PATH = os.path.join('src', 'hazard_model.pkl')
+LEGACY_PATHS = [os.path.join('src', 'methane_model.pkl'),
+                os.path.join('src', 'co_model.pkl'),
+                os.path.join('src', 'temp_model.pkl')]
+STATUS = np.array(LEVELS)
+MAX_BATCH = 512     # readings per predict call
+MAX_WAIT = 0.02     # seconds to wait for a batch to fill up
+MAX_QUEUE = 20000   # readings waiting for prediction; the oldest are dropped beyond this
+LATENCY_WINDOW = 1000
+
+
+class StackedModel:
+    """Wraps the three legacy single-output forests behind one predict()"""
+
+    def __init__(self, models):
+        self.models = models
+        self.n_features_in_ = models[0].n_features_in_
+
+    def predict(self, X):
+        return np.column_stack([m.predict(X) for m in self.models])
+
+
+def model_paths(path=MODEL_PATH, legacy_paths=LEGACY_PATHS, forest_dir=FOREST_DIR):
+    """Files whose change should trigger a model reload"""
+    return [os.path.join(forest_dir, 'meta.json'), path, *legacy_paths]
+
+
+def load_model(path=MODEL_PATH, legacy_paths=LEGACY_PATHS, forest_dir=FOREST_DIR):
+    """Best available model: the memory-mapped compact forest, the pickled
+    multi-output forest, or the three legacy per-target forests"""
+    if os.path.isfile(os.path.join(forest_dir, 'meta.json')):
+        return CompactForest(forest_dir)
+    if os.path.isfile(path):
+        return joblib.load(path)
+    return StackedModel([joblib.load(p) for p in legacy_paths])
+
+
+def classify(preds, thresholds):
+    """Vectorized get_status: (n, 3) predictions -> (n, 3) status strings"""
+    return STATUS[threshold_levels(preds, thresholds)]
+
+
+class InferenceService:
+    """Runs readings through the model in micro-batches on its own thread.
+
+    submit() queues readings from any number of devices; the worker takes up
+    to MAX_BATCH of them (waiting at most MAX_WAIT for more) and makes one
+    vectorized predict call for the whole batch. The latest prediction per
+    device is kept for the UI.
+
+    Every reading also updates its device's FeatureWindow, so sequence
+    models (trained by train_ai.py on lagged / rolling features) get a
+    feature row per reading at no extra model cost; legacy models that take
+    a single [gas, co, temp] reading are fed that instead.
+
+    `get_model` and `get_thresholds` are called once per batch, so a model
+    hot-reloaded by the ResourceRegistry or edited thresholds are picked up
+    on the next batch.
+    """
+
+    def __init__(self, get_model, get_thresholds, max_batch=MAX_BATCH, max_wait=MAX_WAIT, max_queue=MAX_QUEUE):
+        self.get_model = get_model
+        self.get_thresholds = get_thresholds
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = deque(maxlen=max_queue)
+        self.windows = FeatureWindow()
+        self.latest = {}
+        self.listeners = []
+        self.batches = 0
+        self.predicted = 0
+        self.errors = 0
+        self.listener_errors = 0
+        self.dropped = 0
+        self.last_error = ""
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.sizes = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.monotonic()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="inference", daemon=True)
+        self._thread.start()
+
+    def subscribe(self, callback):
+        """Call `callback(results)` with every batch of prediction dicts"""
+        self.listeners.append(callback)
+
+    def submit(self, readings):
+        """Queue reading dicts (device, time, co, gas, temp) for prediction; never blocks the caller"""
+        with self._cond:
+            overflow = len(self.queue) + len(readings) - self.queue.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self.queue.extend(readings)
+            self._cond.notify()
+
+    def predict(self, X):
+        """Synchronous batch prediction: (n, n_features) model inputs -> (preds, statuses)"""
+        return self._predict(self.get_model(), X)
+
+    def _predict(self, model, X):
+        preds = np.asarray(model.predict(np.asarray(X, dtype=float)), dtype=float).reshape(len(X), -1)
+        return preds, classify(preds, self.get_thresholds())
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join(timeout=2)
+
+    def stats(self):
+        with self._cond:
+            latencies = np.array(self.latencies)
+            sizes = np.array(self.sizes)
+            depth = len(self.queue)
+        elapsed = time.monotonic() - self.started
+        return {
+            'queue_depth': depth,
+            'batches': self.batches,
+            'predicted': self.predicted,
+            'errors': self.errors,
+            'listener_errors': self.listener_errors,
+            'dropped': self.dropped,
+            'last_error': self.last_error,
+            'throughput_per_s': round(self.predicted / elapsed, 1) if elapsed else 0.0,
+            'avg_batch': round(float(sizes.mean()), 1) if len(sizes) else 0.0,
+            'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 2) if len(latencies) else 0.0,
+            'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 2) if len(latencies) else 0.0,
+        }
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._stop and not self.queue:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while not self._stop and len(self.queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self.queue), self.max_batch)
+            return [self.queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if self._stop:
+                return
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                features = self.windows.add(batch)
+                model = self.get_model()
+                if model.n_features_in_ != N_FEATURES:
+                    features = [[r[m] for m in METRICS] for r in batch]
+                preds, statuses = self._predict(model, features)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                continue
+            latency = time.perf_counter() - started
+            results = [{'time': r['time'], 'device': r['device'], 'pred': p, 'status': s}
+                       for r, p, s in zip(batch, preds.tolist(), statuses.tolist())]
+            latest = {r['device']: r for r in results}
+            with self._cond:
+                self.latest.update(latest)
+                self.latencies.append(latency)
+                self.sizes.append(len(batch))
+                self.batches += 1
+                self.predicted += len(batch)
+            for callback in self.listeners:
+                try:
+                    callback(results)
+                except Exception as e:
+                    # A failing subscriber must not stop predictions for the others
+                    self.listener_errors += 1
+                    self.last_error = f"listener: {e!r}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hazard model")
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=MAX_BATCH)
+    args = parser.parse_args()
+
+    model = load_model()
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.integers(100, 2000, args.rows), rng.integers(10, 500, args.rows), rng.uniform(20, 50, args.rows)])
+    if model.n_features_in_ == N_FEATURES:
+        # Feature rows of a random walk through the same value ranges
+        walk = np.cumsum(rng.normal(0, [20, 5, 0.1], (args.rows + HISTORY, 3)), axis=0) + X.mean(axis=0)
+        X = series_features(walk)[HISTORY:]
+
+    started = time.perf_counter()
+    for row in X[:200]:
+        model.predict(row.reshape(1, -1))
+    single = (time.perf_counter() - started) / 200
+
+    latencies = []
+    for i in range(0, args.rows, args.batch):
+        t = time.perf_counter()
+        model.predict(X[i:i + args.batch])
+        latencies.append(time.perf_counter() - t)
+    total = sum(latencies)
+    print(f"Single-row predict: {single * 1000:.2f} ms")
+    print(f"Batch {args.batch}: {args.rows / total:.0f} readings/s, "
+          f"p50 {np.percentile(latencies, 50) * 1000:.2f} ms, p99 {np.percentile(latencies, 99) * 1000:.2f} ms per batch")
+
+
+if __name__ == '__main__':
+    main()
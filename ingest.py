@@ -0,0 +1,236 @@
+# ingest.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from devices import FleetPoller, parse_reading
+from ingest_server import LOCAL_HOST, serve
+from log_writer import CsvSink, LogWriter
+from ring import COLUMNS, ReadingRing, to_columns
+
+# --- CONFIGURATION ---
+BUFFER_SIZE = 1000  # readings kept in memory per device
+MAX_PENDING = 1000  # batches waiting for the ingest worker; pushes beyond this are refused
+
+
+class IngestService:
+    """Collects ESP readings on a background thread into per-device ring buffers.
+
+    Readings arrive either by polling the device registry or, when ports are
+    given, pushed by the sensors to the local ingest server. `local_routes`
+    (exports) get their own listener on local_host:local_port, loopback by
+    default, rather than the public ingest port.
+
+    One instance is meant to live per process; Streamlit sessions only read
+    snapshots from it, so the sample rate does not depend on render cost or
+    on how many browser tabs are open.
+
+    Each batch is turned into one (n, 6) array of ring.COLUMNS once, appended to
+    the devices' ReadingRings and handed to column subscribers, so the live
+    views (charts, heatmap, rules) never touch per-reading dicts.
+
+    Polled and pushed batches are recorded one at a time on a single worker
+    thread (submit_batch), so slow subscribers or a large push never stall
+    the event loop that polls the devices, and subscribers are never called
+    concurrently.
+    """
+
+    def __init__(self, devices, data_path, store=None, buffer_size=BUFFER_SIZE, http_port=None, udp_port=None, routes=(),
+                 sinks=(), max_pending=MAX_PENDING, local_port=None, local_host=LOCAL_HOST, local_routes=()):
+        self.devices = list(devices)
+        self.data_path = data_path
+        self.extra_sinks = list(sinks)
+        self.store = store
+        self.http_port = http_port
+        self.udp_port = udp_port
+        self.routes = list(routes)
+        self.local_port = local_port
+        self.local_host = local_host
+        self.local_routes = list(local_routes)
+        self.buffer_size = buffer_size
+        self.max_pending = max_pending
+        self.pending = 0
+        self.refused = 0
+        self.batch_errors = 0
+        self.last_batch_error = ""
+        self._executor = None
+        self.rings = {}     # device id -> ReadingRing
+        self.latest = {}
+        self.lat = None
+        self.lng = None
+        self.last = None
+        self.count = 0
+        self.seq = 0
+        self.last_update = None
+        self.writer = None
+        self.listeners = []
+        self.column_listeners = []
+        self.poller = FleetPoller(self.devices, self._on_reading)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the polling thread (no-op if already running)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self.writer is None:
+                sinks = [CsvSink(self.data_path)] if self.data_path is not None else []
+                sinks += self.extra_sinks
+                if self.store is not None:
+                    sinks.append(self.store)
+                self.writer = LogWriter(sinks)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-batch")
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="esp-ingest", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)  # record what is already queued
+            self._executor = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def subscribe(self, callback):
+        """Call `callback(readings)` with every recorded batch (on the ingest thread)"""
+        self.listeners.append(callback)
+
+    def subscribe_columns(self, callback):
+        """Call `callback(devices, columns)` with every recorded batch as an array of device
+        ids and an (n, len(ring.COLUMNS)) float array (on the ingest thread)"""
+        self.column_listeners.append(callback)
+
+    def apply_settings(self, settings):
+        """ConfigStore listener: device endpoint overrides take effect on the next poll"""
+        self.poller.set_urls(settings.device_urls)
+
+    def set_location(self, lat, lng):
+        """Location stamped onto readings from devices without a fixed position"""
+        with self._lock:
+            self.lat = lat
+            self.lng = lng
+
+    def snapshot(self):
+        """Cheap copy of the latest state for the UI"""
+        stats = {device_id: s.as_dict() for device_id, s in self.poller.stats.items()}
+        with self._lock:
+            return {
+                'latest': self.last,
+                'devices': dict(self.latest),
+                'connected': any(s['failures'] == 0 and s['polls'] > 0 for s in stats.values()),
+                'count': self.count,
+                'seq': self.seq,
+                'error': next((s['last_error'] for s in stats.values() if s['failures']), ""),
+                'last_update': self.last_update,
+                'stats': stats,
+                'handler_errors': self.poller.handler_errors + self.batch_errors,
+                'handler_error': self.last_batch_error or self.poller.last_handler_error,
+                'pending': self.pending,
+                'refused': self.refused,
+                'writer': self.writer.stats() if self.writer is not None else {},
+            }
+
+    def window(self, device, n=None):
+        """Zero-copy (n, len(ring.COLUMNS)) view of a device's last n readings, oldest first.
+
+        The view is overwritten in place once BUFFER_SIZE - n newer readings
+        have arrived; copy it to keep it longer than a frame.
+        """
+        ring = self.rings.get(device)
+        if ring is None:
+            return np.empty((0, len(COLUMNS)))
+        with self._lock:
+            return ring.window(n)
+
+    def _run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        tasks = [self.poller.run(self._stop)]
+        if self.http_port is not None or self.udp_port is not None or self.local_port is not None:
+            tasks.append(serve(self, self._stop, self.http_port, self.udp_port, routes=self.routes,
+                               local_port=self.local_port, local_host=self.local_host, local_routes=self.local_routes))
+        await asyncio.gather(*tasks)
+
+    def _on_reading(self, device, data):
+        co, gas, temp = parse_reading(data)
+        self.submit_batch([{
+            'device': device.id,
+            'lat': device.lat,
+            'lon': device.lon,
+            'co': co,
+            'gas': gas,
+            'temp': temp,
+        }])
+
+    def submit_batch(self, rows):
+        """Queue validated rows for ingest_batch on the worker thread.
+
+        Returns a concurrent Future, or None if MAX_PENDING batches are
+        already waiting (the rows are counted in `refused`).
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.refused += len(rows)
+                return None
+            self.pending += 1
+        return self._executor.submit(self._record, rows)
+
+    def _record(self, rows):
+        try:
+            self.ingest_batch(rows)
+        except Exception as e:
+            self.batch_errors += 1
+            self.last_batch_error = repr(e)
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def ingest_batch(self, rows):
+        """Record already-validated rows (see ingest_server.validate_batch)"""
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            readings = [{
+                'time': datetime.fromtimestamp(row.get('ts') or now),
+                'device': row['device'],
+                'lat': row['lat'] if row.get('lat') is not None else self.lat,
+                'lng': row['lon'] if row.get('lon') is not None else self.lng,
+                'co': row['co'],
+                'gas': row['gas'],
+                'temp': row['temp'],
+            } for row in rows]
+
+        devices = np.array([r['device'] for r in readings])
+        columns = to_columns(readings)
+
+        self.writer.write(readings)
+        for callback in self.listeners:
+            callback(readings)
+        for callback in self.column_listeners:
+            callback(devices, columns)
+
+        with self._lock:
+            for device in set(devices.tolist()):
+                ring = self.rings.get(device)
+                if ring is None:
+                    ring = self.rings[device] = ReadingRing(self.buffer_size)
+                ring.append(columns[devices == device])
+                self.latest[device] = readings[np.flatnonzero(devices == device)[-1]]
+            self.last = readings[-1]
+            self.count += len(readings)
+            self.seq += 1
+            self.last_update = readings[-1]['time']
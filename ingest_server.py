@@ -0,0 +1,166 @@
+# ingest_server.py
+import asyncio
+import json
+import time
+
+import numpy as np
+from aiohttp import web
+
+from devices import check_device_id, parse_reading
+
+# --- LIMITS ---
+CO_RANGE = (0, 10000)
+GAS_RANGE = (0, 10000)
+TEMP_RANGE = (-40.0, 125.0)
+MAX_CLOCK_SKEW = 300  # seconds a reading may be stamped in the future
+MAX_BATCH = 10000
+
+# --- CONFIGURATION ---
+LOCAL_HOST = '127.0.0.1'  # bind address of the local-only listener (exports)
+
+
+def validate_batch(items, device=None):
+    """Validate raw reading dicts in bulk; returns (rows, rejected_count)
+
+    Each item needs co/gas/temp and a device id (either its own or the
+    batch-level `device`, at most devices.MAX_ID_BYTES long); ts, lat and
+    lon are optional.
+    """
+    parsed = []
+    for item in items[:MAX_BATCH]:
+        try:
+            co, gas, temp = parse_reading(item)
+            device_id = item.get('device', device)
+            if device_id is None:
+                continue
+            ts = item.get('ts')
+            lat = item.get('lat')
+            lon = item.get('lon')
+            parsed.append({
+                'device': check_device_id(device_id),
+                'ts': None if ts is None else float(ts),
+                'lat': None if lat is None else float(lat),
+                'lon': None if lon is None else float(lon),
+                'co': co,
+                'gas': gas,
+                'temp': temp,
+            })
+        except (KeyError, TypeError, ValueError, AttributeError, OverflowError):  # int(inf) from 1e400 or Infinity
+            continue
+    rejected = len(items) - len(parsed)
+    if not parsed:
+        return [], rejected
+
+    # Range checks run as one vectorized pass over the whole batch
+    now = time.time()
+    values = np.array([(r['co'], r['gas'], r['temp'], r['ts'] or now) for r in parsed], dtype=float)
+    co, gas, temp, ts = values.T
+    ok = np.isfinite(values).all(axis=1)
+    ok &= (co >= CO_RANGE[0]) & (co <= CO_RANGE[1])
+    ok &= (gas >= GAS_RANGE[0]) & (gas <= GAS_RANGE[1])
+    ok &= (temp >= TEMP_RANGE[0]) & (temp <= TEMP_RANGE[1])
+    ok &= (ts > 0) & (ts <= now + MAX_CLOCK_SKEW)
+
+    rows = [r for r, good in zip(parsed, ok) if good]
+    return rows, rejected + len(parsed) - len(rows)
+
+
+def parse_lines(text):
+    """Parse line protocol: one `device,ts,co,gas,temp` reading per line (ts may be empty)"""
+    items = []
+    for line in text.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) != 5:
+            items.append({})  # counted as rejected by validate_batch
+            continue
+        device, ts, co, gas, temp = fields
+        items.append({'device': device, 'ts': ts or None, 'co': co, 'gas': gas, 'temp': temp})
+    return items
+
+
+def make_app(service, routes=()):
+    """HTTP app accepting JSON batches on POST /ingest
+
+    Body is either a list of readings or {"device": id, "readings": [...]}.
+    Extra (method, path, handler) `routes` are mounted on the same app.
+    """
+    async def ingest(request):
+        try:
+            body = await request.json(loads=json.loads)
+        except ValueError:
+            return web.json_response({'error': 'invalid JSON'}, status=400)
+        if isinstance(body, dict):
+            items, device = body.get('readings', []), body.get('device')
+        else:
+            items, device = body, None
+        if not isinstance(items, list):
+            return web.json_response({'error': 'readings must be a list'}, status=400)
+        rows, rejected = validate_batch(items, device)
+        if rows:
+            # Recorded on the service's worker thread; the event loop keeps polling meanwhile
+            future = service.submit_batch(rows)
+            if future is None:
+                return web.json_response({'error': 'ingest queue full', 'rejected': len(items)}, status=503)
+            try:
+                await asyncio.wrap_future(future)
+            except Exception:
+                return web.json_response({'error': 'failed to record readings'}, status=500)
+        return web.json_response({'accepted': len(rows), 'rejected': rejected})
+
+    app = web.Application(client_max_size=16 * 1024 ** 2)
+    app.router.add_post('/ingest', ingest)
+    for method, path, handler in routes:
+        app.router.add_route(method, path, handler)
+    return app
+
+
+class LineProtocol(asyncio.DatagramProtocol):
+    """UDP listener; each datagram carries one or more line-protocol readings"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def datagram_received(self, data, addr):
+        rows, _ = validate_batch(parse_lines(data.decode('utf-8', 'replace')))
+        if rows:
+            self.service.submit_batch(rows)  # fire and forget; refusals are counted by the service
+
+
+def make_local_app(routes):
+    """HTTP app carrying only `routes`, for endpoints that must not share the public listener"""
+    app = web.Application()
+    for method, path, handler in routes:
+        app.router.add_route(method, path, handler)
+    return app
+
+
+async def serve(service, stop, http_port=None, udp_port=None, host='0.0.0.0', routes=(),
+                local_port=None, local_host=LOCAL_HOST, local_routes=()):
+    """Run the push endpoints until the threading.Event `stop` is set
+
+    `local_routes` are served on their own listener at local_host:local_port,
+    which defaults to the loopback interface.
+    """
+    runners = []
+    transport = None
+    try:
+        if http_port is not None:
+            runner = web.AppRunner(make_app(service, routes), access_log=None)
+            runners.append(runner)
+            await runner.setup()
+            await web.TCPSite(runner, host, http_port).start()
+        if local_port is not None:
+            runner = web.AppRunner(make_local_app(local_routes), access_log=None)
+            runners.append(runner)
+            await runner.setup()
+            await web.TCPSite(runner, local_host, local_port).start()
+        if udp_port is not None:
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(lambda: LineProtocol(service), local_addr=(host, udp_port))
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+    finally:
+        if transport is not None:
+            transport.close()
+        for runner in runners:
+            await runner.cleanup()
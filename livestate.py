@@ -0,0 +1,378 @@
+# livestate.py
+"""Live readings shared between processes through one memory-mapped segment.
+
+Streamlit is scaled by running several server processes behind a load
+balancer. Exactly one of them (whoever holds LOCK_PATH) runs the
+IngestService and publishes into the segment with a LivePublisher; every
+process, including that one, renders from a LiveState reader mapped onto the
+same pages, so 30 screens cost one poller and no per-session copies.
+
+Layout (all little-endian, fixed at creation):
+
+    header    HEADER_FIELDS as float64
+    ids       max_devices x 32-byte device ids
+    cursors   max_devices x (head, count) int64
+    preds     max_devices x (ts, gas, co, temp, gas_lvl, co_lvl, temp_lvl) float64
+    rings     max_devices x (2 * capacity, len(ring.COLUMNS)) float64, mirrored like ReadingRing
+    status    STATUS_BYTES of JSON (poller / writer stats)
+
+Consistency is a seqlock: the single writer makes `seq` odd, updates
+cursors / predictions / status, then makes it even again. Readers retry
+until they see the same even `seq` before and after reading a cursor.
+Ring rows are written before the cursor that exposes them, and a mirrored
+ring never rewrites a row until `capacity - n` newer ones have arrived, so
+window() can hand out views of the shared pages without copying.
+"""
+import fcntl
+import json
+import mmap
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from ingest import BUFFER_SIZE
+from ring import COL, COLUMNS
+from rules import LEVELS, METRICS
+
+# --- CONFIGURATION ---
+LIVE_PATH = '/dev/shm/safesight-live' if os.path.isdir('/dev/shm') else os.path.join('data', 'live.shm')
+LOCK_PATH = LIVE_PATH + '.lock'
+MAX_DEVICES = 64        # minimum device slots; LivePublisher.acquire callers size it from the registry
+OVERFLOW_IDS = 100      # device ids without a slot remembered for the status report
+STATUS_BYTES = 64 * 1024
+STATUS_INTERVAL = 0.5   # seconds between status / heartbeat updates
+STALE_SECONDS = 5.0     # a publisher silent this long is considered gone
+MAGIC = 0x5AFE5167
+LAYOUT_VERSION = 1
+HEADER_FIELDS = ('magic', 'layout', 'capacity', 'max_devices', 'seq', 'heartbeat',
+                 'devices', 'count', 'batches', 'last_update', 'status_len', 'pid')
+H = {name: i for i, name in enumerate(HEADER_FIELDS)}
+ID_BYTES = 32
+PRED_FIELDS = 1 + 2 * len(METRICS)
+
+
+def _layout(capacity, max_devices):
+    """name -> (offset, dtype, shape) of every array in the segment"""
+    arrays = [
+        ('header', np.float64, (len(HEADER_FIELDS),)),
+        ('ids', f'S{ID_BYTES}', (max_devices,)),
+        ('cursors', np.int64, (max_devices, 2)),
+        ('preds', np.float64, (max_devices, PRED_FIELDS)),
+        ('rings', np.float64, (max_devices, 2 * capacity, len(COLUMNS))),
+        ('status', np.uint8, (STATUS_BYTES,)),
+    ]
+    out, offset = {}, 0
+    for name, dtype, shape in arrays:
+        out[name] = (offset, dtype, shape)
+        offset += int(np.dtype(dtype).itemsize * np.prod(shape))
+        offset = -(-offset // 64) * 64  # cache-line align the next array
+    return out, offset
+
+
+def _views(buf, capacity, max_devices):
+    layout, _ = _layout(capacity, max_devices)
+    return {name: np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+            for name, (offset, dtype, shape) in layout.items()}
+
+
+class LivePublisher:
+    """The single writer of the live segment; one per host, chosen by file lock.
+
+    acquire() returns None when another process already publishes. The lock
+    is released by the OS when the publishing process exits, so a reader
+    that finds the segment stale can simply try to acquire it again.
+    """
+
+    def __init__(self, lock_file, path=LIVE_PATH, capacity=BUFFER_SIZE, max_devices=MAX_DEVICES):
+        self.lock_file = lock_file
+        self.path = path
+        self.capacity = capacity
+        self.max_devices = max_devices
+        self.slots = {}
+        self.dropped = 0        # readings of devices that found no free slot
+        self.overflow = set()   # those devices' ids (up to OVERFLOW_IDS)
+        _, size = _layout(capacity, max_devices)
+        # Build the new segment aside and rename it in, so readers of a previous
+        # publisher's segment never see a half-initialized header
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w+b') as f:
+            f.truncate(size)
+            self.mm = mmap.mmap(f.fileno(), size)
+        self.v = _views(self.mm, capacity, max_devices)
+        header = self.v['header']
+        header[H['capacity']] = capacity
+        header[H['max_devices']] = max_devices
+        header[H['layout']] = LAYOUT_VERSION
+        header[H['pid']] = os.getpid()
+        header[H['heartbeat']] = time.time()
+        header[H['magic']] = MAGIC
+        os.replace(tmp, path)
+        self._lock = threading.Lock()
+        self._status_thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def acquire(cls, path=LIVE_PATH, lock_path=LOCK_PATH, **kwargs):
+        folder = os.path.dirname(lock_path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return cls(lock_file, path, **kwargs)
+
+    def publish(self, devices, columns):
+        """IngestService column listener: append a batch to the devices' shared rings"""
+        with self._lock:
+            header, cursors, rings = self.v['header'], self.v['cursors'], self.v['rings']
+            moved = {}
+            for device in set(devices.tolist()):
+                slot = self._slot(device)
+                if slot is None:
+                    self.dropped += int(np.count_nonzero(devices == device))
+                    continue
+                rows = columns[devices == device][-self.capacity:]
+                head, count = cursors[slot]
+                n = len(rows)
+                first = min(n, self.capacity - head)
+                # Rows first, cursor after: a reader never sees a cursor ahead of its data
+                for offset in (0, self.capacity):
+                    rings[slot, offset + head:offset + head + first] = rows[:first]
+                    rings[slot, offset:offset + n - first] = rows[first:]
+                moved[slot] = ((head + n) % self.capacity, count + n)
+            self._begin()
+            for slot, cursor in moved.items():
+                cursors[slot] = cursor
+            header[H['count']] += len(columns)
+            header[H['batches']] += 1
+            header[H['last_update']] = columns[-1, COL['ts']]
+            self._end()
+
+    def publish_predictions(self, results):
+        """InferenceService listener: latest prediction per device"""
+        latest = {r['device']: r for r in results}
+        with self._lock:
+            rows = {}
+            for device, r in latest.items():
+                slot = self._slot(device)
+                if slot is not None:
+                    rows[slot] = [r['time'].timestamp()] + list(r['pred']) + [LEVELS.index(s) for s in r['status']]
+            self._begin()
+            for slot, row in rows.items():
+                self.v['preds'][slot] = row
+            self._end()
+
+    def publish_status(self, snapshot):
+        """Poller / writer stats from IngestService.snapshot(); also the liveness heartbeat"""
+        status = {key: snapshot[key] for key in ('connected', 'error', 'stats', 'writer', 'handler_errors', 'handler_error')}
+        status['live'] = self.usage()
+        data = json.dumps(status, default=str).encode()
+        if len(data) > STATUS_BYTES:
+            # Too many devices for the status area: keep the fleet-level fields
+            data = json.dumps({**status, 'stats': {}}, default=str).encode()[:STATUS_BYTES]
+        with self._lock:
+            self._begin()
+            self.v['status'][:len(data)] = np.frombuffer(data, dtype=np.uint8)
+            self.v['header'][H['status_len']] = len(data)
+            self.v['header'][H['heartbeat']] = time.time()
+            self._end()
+
+    def start_status(self, snapshot, interval=STATUS_INTERVAL):
+        """Publish `snapshot()` every `interval` seconds on a background thread"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.publish_status(snapshot())
+                except Exception:
+                    pass  # a bad stats value must not stop the heartbeat for good
+        self.publish_status(snapshot())
+        self._status_thread = threading.Thread(target=run, name="live-status", daemon=True)
+        self._status_thread.start()
+
+    def usage(self):
+        """Slot use, and the devices left out of the live segment because every slot was taken"""
+        return {'slots': self.max_devices, 'used': len(self.slots), 'dropped': self.dropped,
+                'dropped_devices': sorted(self.overflow)}
+
+    def close(self):
+        self._stop.set()
+        if self._status_thread is not None:
+            self._status_thread.join(timeout=2)
+        self.lock_file.close()
+
+    def _slot(self, device):
+        slot = self.slots.get(device)
+        if slot is None:
+            if len(self.slots) >= self.max_devices:
+                if len(self.overflow) < OVERFLOW_IDS:
+                    self.overflow.add(device)
+                return None
+            slot = len(self.slots)
+            self.slots[device] = slot
+            self._begin()
+            self.v['ids'][slot] = str(device).encode()[:ID_BYTES]
+            self.v['header'][H['devices']] = len(self.slots)
+            self._end()
+        return slot
+
+    def _begin(self):
+        self.v['header'][H['seq']] += 1   # odd: write in progress
+
+    def _end(self):
+        self.v['header'][H['seq']] += 1   # even: consistent again
+
+
+class LiveState:
+    """Read-only view of the live segment, with the read API of IngestService.
+
+    snapshot() and window() read the shared pages directly; nothing is
+    copied except the few header values and the status JSON. If the
+    publisher restarts, the new segment is picked up automatically.
+    """
+
+    def __init__(self, path=LIVE_PATH, devices=(), store=None):
+        self.path = path
+        self.devices = list(devices)
+        self.store = store
+        self.mm = None
+        self.v = None
+        self.inode = None
+        self.slots = {}
+        self._status_cache = (None, {})
+
+    def alive(self):
+        """True when a publisher has sent a heartbeat within STALE_SECONDS"""
+        if not self._attach():
+            return False
+        return time.time() - self.v['header'][H['heartbeat']] < STALE_SECONDS
+
+    def set_location(self, lat, lng):
+        """Locations are stamped by the publishing process; readers cannot change them"""
+
+    def snapshot(self):
+        """Same keys as IngestService.snapshot()"""
+        empty = {'latest': None, 'devices': {}, 'connected': False, 'count': 0, 'seq': 0,
+                 'error': "Waiting for the ingest process", 'last_update': None, 'stats': {}, 'writer': {},
+                 'handler_errors': 0, 'handler_error': "", 'live': {}}
+        if not self.alive():
+            return empty
+        header, status = self._read(lambda v: (v['header'].copy(), v['status'][:int(v['header'][H['status_len']])].tobytes()))
+        if status != self._status_cache[0]:
+            self._status_cache = (status, json.loads(status) if status else {})
+        info = self._status_cache[1]
+        self._refresh_slots(int(header[H['devices']]))
+        latest = {}
+        for device in self.slots:
+            row = self.window(device, 1)
+            if len(row):
+                latest[device] = _reading(device, row[0])
+        newest = max(latest.values(), key=lambda r: r['time'], default=None)
+        return {
+            'latest': newest,
+            'devices': latest,
+            'connected': info.get('connected', False),
+            'count': int(header[H['count']]),
+            'seq': int(header[H['batches']]),
+            'error': info.get('error', ""),
+            'last_update': datetime.fromtimestamp(header[H['last_update']]) if header[H['count']] else None,
+            'stats': info.get('stats', {}),
+            'writer': info.get('writer', {}),
+            'handler_errors': info.get('handler_errors', 0),
+            'handler_error': info.get('handler_error', ""),
+            'live': info.get('live', {}),
+        }
+
+    def window(self, device, n=None, copy=False):
+        """Zero-copy read-only view of a device's last n readings, oldest first.
+
+        Like ReadingRing.window, the rows stay valid until capacity - n newer
+        readings have arrived. With copy=True the rows are copied and the copy
+        is retried if the writer lapped it meanwhile, for callers that keep
+        them or run slower than the stream.
+        """
+        if not self._attach():
+            return np.empty((0, len(COLUMNS)))
+        slot = self._device_slot(device)
+        if slot is None:
+            return np.empty((0, len(COLUMNS)))
+        capacity = int(self.v['header'][H['capacity']])
+        while True:
+            head, count = self._read(lambda v: v['cursors'][slot].tolist())
+            n_rows = min(count, capacity) if n is None else min(n, count, capacity)
+            end = head + capacity
+            rows = self.v['rings'][slot, end - n_rows:end]
+            if not copy:
+                return rows
+            rows = rows.copy()
+            if self._read(lambda v: int(v['cursors'][slot, 1])) - count <= capacity - n_rows:
+                return rows
+
+    def prediction(self, device):
+        """Latest prediction for a device, shaped like InferenceService.latest entries, or None"""
+        if not self._attach():
+            return None
+        slot = self._device_slot(device)
+        if slot is None:
+            return None
+        row = self._read(lambda v: v['preds'][slot].copy())
+        if row[0] == 0:
+            return None
+        k = len(METRICS)
+        return {'time': datetime.fromtimestamp(row[0]), 'device': device, 'pred': row[1:1 + k].tolist(),
+                'status': [LEVELS[int(lvl)] for lvl in row[1 + k:]]}
+
+    def _read(self, fn):
+        """Run fn(views) until it saw no concurrent write (seqlock read side)"""
+        header = self.v['header']
+        while True:
+            before = header[H['seq']]
+            if before % 2 == 0:
+                out = fn(self.v)
+                if header[H['seq']] == before:
+                    return out
+            time.sleep(0)
+
+    def _device_slot(self, device):
+        slot = self.slots.get(device)
+        if slot is None:
+            self._refresh_slots(int(self.v['header'][H['devices']]))
+            slot = self.slots.get(device)
+        return slot
+
+    def _refresh_slots(self, n):
+        if n != len(self.slots):
+            ids = self.v['ids'][:n].tolist()
+            self.slots = {i.decode(): slot for slot, i in enumerate(ids)}
+
+    def _attach(self):
+        """Map the current segment, remapping when a new publisher replaced it"""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return self.v is not None
+        if inode == self.inode:
+            return True
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(mm, dtype=np.float64, count=len(HEADER_FIELDS))
+        if header[H['magic']] != MAGIC or header[H['layout']] != LAYOUT_VERSION:
+            return self.v is not None
+        self.mm = mm
+        self.v = _views(mm, int(header[H['capacity']]), int(header[H['max_devices']]))
+        self.inode = inode
+        self.slots = {}
+        return True
+
+
+def _reading(device, row):
+    """One ring row as the reading dict IngestService hands out"""
+    lat, lon = row[COL['lat']], row[COL['lon']]
+    return {'time': datetime.fromtimestamp(row[COL['ts']]), 'device': device,
+            'lat': None if np.isnan(lat) else float(lat), 'lng': None if np.isnan(lon) else float(lon),
+            'co': float(row[COL['co']]), 'gas': float(row[COL['gas']]), 'temp': float(row[COL['temp']])}
@@ -0,0 +1,194 @@
+# log_writer.py
+import atexit
+import os
+import threading
+import time
+
+# --- DEFAULTS ---
+FLUSH_ROWS = 500       # flush once this many rows are queued
+FLUSH_DELAY = 1.0      # ...or once the oldest queued row is this old (seconds)
+FSYNC_INTERVAL = 5.0   # used by the 'interval' fsync policy
+FSYNC_POLICIES = ('always', 'interval', 'never')
+MAX_RETRY_ROWS = 100000  # rows kept per failing sink for retry; the oldest are dropped beyond this
+
+
+class CsvSink:
+    """Appends readings to the CSV log through one long-lived file handle"""
+
+    HEADER = "lat,lon,co,gas,temp\n"
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        is_new = not os.path.isfile(path) or os.path.getsize(path) == 0
+        self.f = open(path, 'a')
+        if is_new:
+            self.f.write(self.HEADER)
+
+    def write(self, readings):
+        self.f.write("".join(f"{r['lat']},{r['lng']},{r['co']},{r['gas']},{r['temp']}\n" for r in readings))
+        self.f.flush()
+
+    def fsync(self):
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+
+class LogWriter:
+    """Write-behind logger: queues readings in memory and flushes them in batches.
+
+    A background thread flushes when FLUSH_ROWS rows are queued or the oldest
+    row has waited FLUSH_DELAY seconds, so at most that much is lost on a
+    crash. close() (also run at interpreter exit) drains the queue, so a
+    clean shutdown loses nothing.
+
+    fsync policy: 'always' syncs after every flush, 'interval' at most every
+    FSYNC_INTERVAL seconds, 'never' leaves it to the OS.
+
+    A sink that raises keeps its rows (up to MAX_RETRY_ROWS) and gets them
+    again, ahead of newer ones, every FLUSH_DELAY seconds; the other sinks
+    and the writer thread carry on. Failures show up in stats().
+    """
+
+    def __init__(self, sinks, flush_rows=FLUSH_ROWS, flush_delay=FLUSH_DELAY,
+                 fsync='interval', fsync_interval=FSYNC_INTERVAL, max_retry_rows=MAX_RETRY_ROWS):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.sinks = list(sinks)
+        self.flush_rows = flush_rows
+        self.flush_delay = flush_delay
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_retry_rows = max_retry_rows
+        self.retry = [[] for _ in self.sinks]   # rows each sink failed to take, oldest first
+        self.failed_at = None
+        self.errors = 0
+        self.dropped = 0
+        self.last_error = ""
+        self.queue = []
+        self.oldest = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.last_fsync = time.monotonic()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, readings):
+        """Queue readings; returns immediately"""
+        with self._cond:
+            if self._closed:
+                raise ValueError("LogWriter is closed")
+            if not readings:
+                return
+            if not self.queue:
+                # Starts the writer thread's FLUSH_DELAY timer
+                self.oldest = time.monotonic()
+                self._cond.notify()
+            self.queue.extend(readings)
+            if len(self.queue) >= self.flush_rows:
+                self._cond.notify()
+
+    def flush(self):
+        """Write everything queued so far"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self.queue = self.queue, []
+                self.oldest = None
+            if not batch and not any(self.retry):
+                return
+            started = time.perf_counter()
+            for i, sink in enumerate(self.sinks):
+                rows = self.retry[i] + batch if self.retry[i] else batch
+                if not rows:
+                    continue
+                try:
+                    sink.write(rows)
+                    self.retry[i] = []
+                except Exception as e:
+                    self._failed(sink, e)
+                    self.dropped += max(len(rows) - self.max_retry_rows, 0)
+                    self.retry[i] = rows[-self.max_retry_rows:]
+            now = time.monotonic()
+            if self.fsync == 'always' or (self.fsync == 'interval' and now - self.last_fsync >= self.fsync_interval):
+                for sink in self.sinks:
+                    try:
+                        sink.fsync()
+                    except Exception as e:
+                        self._failed(sink, e)
+                self.last_fsync = now
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.rows_written += len(batch)
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+
+    def close(self):
+        """Drain the queue, sync and close the sinks (idempotent)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        self.flush()
+        for sink in self.sinks:
+            try:
+                if self.fsync != 'never':
+                    sink.fsync()
+                sink.close()
+            except Exception as e:
+                self._failed(sink, e)
+        atexit.unregister(self.close)
+
+    def stats(self):
+        with self._cond:
+            depth = len(self.queue)
+        return {
+            'queue_depth': depth,
+            'rows_written': self.rows_written,
+            'flushes': self.flushes,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            'max_flush_ms': round(self.max_flush_ms, 2),
+            'errors': self.errors,
+            'retry_rows': sum(len(rows) for rows in self.retry),
+            'dropped': self.dropped,
+            'last_error': self.last_error,
+        }
+
+    def _failed(self, sink, error):
+        self.errors += 1
+        self.last_error = f"{type(sink).__name__}: {error}"
+        self.failed_at = time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and len(self.queue) < self.flush_rows:
+                    # Flush FLUSH_DELAY after the oldest queued row, or after the last failure if rows await retry
+                    since = self.oldest if self.oldest is not None else self.failed_at if any(self.retry) else None
+                    if since is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self.flush_delay - (time.monotonic() - since)
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                self._failed(self, e)
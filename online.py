@@ -0,0 +1,215 @@
+# online.py
+import copy
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
+
+from forecast import HORIZON, MAX_GAP, METRICS, N_FEATURES, STEP, FeatureWindow
+
+# --- CONFIGURATION ---
+MAX_QUEUE = 20000       # readings waiting to be learned from; the oldest are dropped beyond this
+MAX_BATCH = 1000
+SWAP_INTERVAL = 60.0    # seconds between promotion checks
+MIN_SAMPLES = 500       # labelled rows scored before the online model may be promoted
+SCORE_WINDOW = 2000     # labelled rows in the rolling error comparison
+MIN_GAIN = 0.05         # promote only when the online model's error is this much lower
+
+
+class OnlineForecaster:
+    """Frozen copy of the online models, served like any other hazard model"""
+
+    def __init__(self, scaler, models):
+        self.scaler = scaler
+        self.models = models
+        self.base_features = list(range(len(METRICS)))
+        self.n_features_in_ = N_FEATURES
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        Xs = self.scaler.transform(X)
+        return X[:, self.base_features] + np.column_stack([m.predict(Xs) for m in self.models])
+
+
+class OnlineLearner:
+    """Learns a next-10-second forecaster from the live reading stream.
+
+    Readings are featurized exactly like InferenceService does; each
+    feature row waits until the reading HORIZON seconds later arrives and
+    becomes its label. Labelled rows are first scored (test-then-train) by
+    both the online model and the model currently served, then fed to one
+    SGDRegressor per target via partial_fit, so each reading costs a bounded
+    amount of work on the learner's own thread.
+
+    Every SWAP_INTERVAL seconds the online model is promoted, as a frozen
+    copy swapped in by reference, when its rolling error beats the served
+    model's by MIN_GAIN. A newly trained offline model replaces it again.
+    """
+
+    def __init__(self, get_offline, swap_interval=SWAP_INTERVAL, min_samples=MIN_SAMPLES,
+                 score_window=SCORE_WINDOW, max_queue=MAX_QUEUE):
+        self.get_offline = get_offline
+        self.swap_interval = swap_interval
+        self.min_samples = min_samples
+        self.windows = FeatureWindow()
+        self.pending = {}   # device -> deque of (ts, features) waiting for their label
+        self.scaler = StandardScaler()
+        self.models = [SGDRegressor(loss='huber', epsilon=5.0, alpha=1e-4, eta0=0.005) for _ in METRICS]
+        self.model = None   # promoted OnlineForecaster, or None while the offline model serves
+        self.offline = None
+        self.queue = deque(maxlen=max_queue)
+        self.served_err = deque(maxlen=score_window)
+        self.online_err = deque(maxlen=score_window)
+        self.shift = deque(maxlen=score_window)
+        self.recent_x = deque(maxlen=score_window)
+        self.learned = 0
+        self.dropped = 0
+        self.swaps = 0
+        self.last_swap = None
+        self.last_error = ""
+        self.checked_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="online-learner", daemon=True)
+        self._thread.start()
+
+    def submit(self, readings):
+        """Queue reading dicts (device, time, gas, co, temp); never blocks the caller"""
+        with self._cond:
+            overflow = len(self.queue) + len(readings) - self.queue.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self.queue.extend(readings)
+            self._cond.notify()
+
+    def serving(self):
+        """The model the prediction path should use right now"""
+        offline = self.get_offline()
+        if offline is not self.offline:
+            # A freshly trained offline model takes over until the online one beats it again
+            self.offline = offline
+            self.model = None
+        return self.model if self.model is not None else offline
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join(timeout=2)
+
+    def stats(self):
+        with self._cond:
+            depth = len(self.queue)
+            served = np.array(self.served_err)
+            online = np.array(self.online_err)
+            shift = np.array(self.shift)
+            recent = np.array(self.recent_x)
+        out = {
+            'serving': 'online' if self.model is not None else 'offline',
+            'queue_depth': depth,
+            'learned': self.learned,
+            'dropped': self.dropped,
+            'swaps': self.swaps,
+            'last_swap': self.last_swap,
+            'error': self.last_error,
+        }
+        if len(online):
+            out['served_mae'] = dict(zip(METRICS, np.round(served.mean(axis=0), 2).tolist()))
+            out['online_mae'] = dict(zip(METRICS, np.round(online.mean(axis=0), 2).tolist()))
+            # How far apart the two models' forecasts are, and how far the
+            # recent inputs sit from everything the online model has seen
+            out['prediction_shift'] = dict(zip(METRICS, np.round(shift.mean(axis=0), 2).tolist()))
+            z = np.abs(recent.mean(axis=0) - self.scaler.mean_[:len(METRICS)]) / np.sqrt(self.scaler.var_[:len(METRICS)] + 1e-9)
+            out['input_drift_z'] = dict(zip(METRICS, np.round(z, 2).tolist()))
+        return out
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._stop and not self.queue:
+                self._cond.wait(self.swap_interval)
+                if not self.queue:
+                    return []
+            n = min(len(self.queue), MAX_BATCH)
+            return [self.queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if self._stop:
+                return
+            try:
+                if batch:
+                    self._learn(batch)
+                if time.monotonic() - self.checked_at >= self.swap_interval:
+                    self.checked_at = time.monotonic()
+                    self._maybe_promote()
+            except Exception as e:
+                self.last_error = str(e)
+
+    def _learn(self, batch):
+        features = self.windows.add(batch)
+        X, Y = [], []
+        for r, row in zip(batch, features):
+            ts = r['time'].timestamp()
+            waiting = self.pending.setdefault(r['device'], deque())
+            while waiting and waiting[0][0] + HORIZON * STEP <= ts:
+                row_ts, row_x = waiting.popleft()
+                if ts - row_ts <= (HORIZON + MAX_GAP) * STEP:  # no label across a long outage
+                    X.append(row_x)
+                    Y.append([r[m] for m in METRICS])
+            waiting.append((ts, row))
+        if not X:
+            return
+        X = np.array(X, dtype=float)
+        Y = np.array(Y, dtype=float)
+        current = X[:, :len(METRICS)]
+
+        # Test, then train
+        try:
+            serving = self.serving()
+        except RuntimeError:
+            serving = None  # no offline model loaded yet: learn, but nothing to compare against
+        if self.learned and serving is not None:
+            online = OnlineForecaster(self.scaler, self.models).predict(X)
+            served = _predict(serving, X)
+            with self._cond:
+                self.online_err.extend(np.abs(online - Y))
+                self.served_err.extend(np.abs(served - Y))
+                self.shift.extend(np.abs(online - served))
+                self.recent_x.extend(current)
+        self.scaler.partial_fit(X)
+        Xs = self.scaler.transform(X)
+        for m, model in enumerate(self.models):
+            model.partial_fit(Xs, Y[:, m] - current[:, m])
+        self.learned += len(X)
+
+    def _maybe_promote(self):
+        with self._cond:
+            if len(self.online_err) < self.min_samples:
+                return
+            online = np.array(self.online_err).mean(axis=0)
+            served = np.array(self.served_err).mean(axis=0)
+        # Average relative error over the three targets
+        ratio = float(np.mean(online / np.maximum(served, 1e-9)))
+        if ratio < 1 - MIN_GAIN:
+            # Swapping the reference is atomic; the inference thread sees the old or the new model
+            self.model = OnlineForecaster(copy.deepcopy(self.scaler), copy.deepcopy(self.models))
+            self.swaps += 1
+            self.last_swap = time.strftime('%H:%M:%S')
+            with self._cond:
+                # Scores so far compared against the previous served model
+                self.served_err.clear()
+                self.online_err.clear()
+                self.shift.clear()
+
+
+def _predict(model, X):
+    """Forecast with any hazard model, feeding single-reading models just the current values"""
+    if model.n_features_in_ != N_FEATURES:
+        X = X[:, :len(METRICS)]
+    return np.asarray(model.predict(X), dtype=float).reshape(len(X), -1)
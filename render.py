@@ -0,0 +1,77 @@
+# render.py
+import time
+
+# --- CONFIGURATION ---
+DEFAULT_FRAME_MS = 500
+
+
+class Widget:
+    def __init__(self, draw, every_ms):
+        self.draw = draw
+        self.every_ms = every_ms
+        self.pending = None
+        self.shown = None
+        self.drawn_at = None
+
+
+class RenderScheduler:
+    """Coalesces live updates into UI frames at a fixed rate.
+
+    Producers call update() as often as they like; only the latest value per
+    widget is kept. tick() runs once per frame and redraws a widget only when
+    its value changed since it was last drawn and its own interval (never
+    shorter than one frame) has elapsed, so expensive widgets can refresh
+    less often than cheap ones.
+    """
+
+    def __init__(self, frame_ms=DEFAULT_FRAME_MS):
+        self.frame_ms = frame_ms
+        self.widgets = {}
+        self.frames = 0
+        self.draws = 0
+        self.skipped = 0
+        self._deadline = time.monotonic()
+
+    def add(self, name, draw=None, every_ms=0):
+        """Register a widget; `draw(value)` renders it. Widgets without `draw`
+        are refreshed client-side and only use interval_ms()."""
+        self.widgets[name] = Widget(draw, every_ms)
+
+    def interval_ms(self, name):
+        return max(self.widgets[name].every_ms, self.frame_ms)
+
+    def update(self, name, value):
+        self.widgets[name].pending = value
+
+    def tick(self):
+        """Draw every widget that is due and has a new value; returns the number drawn"""
+        now = time.monotonic()
+        drawn = 0
+        for name, w in self.widgets.items():
+            if w.draw is None or w.pending is None:
+                continue
+            if w.pending == w.shown:
+                self.skipped += 1
+                continue
+            if w.drawn_at is not None and (now - w.drawn_at) * 1000 < self.interval_ms(name):
+                continue
+            w.draw(w.pending)
+            w.shown = w.pending
+            w.drawn_at = now
+            drawn += 1
+        self.frames += 1
+        self.draws += drawn
+        return drawn
+
+    def wait(self):
+        """Sleep until the next frame boundary; time spent drawing counts toward the frame"""
+        self._deadline += self.frame_ms / 1000
+        delay = self._deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Fell behind (slow draw or client); drop the missed frames instead of bursting
+            self._deadline = time.monotonic()
+
+    def stats(self):
+        return {'frame_ms': self.frame_ms, 'frames': self.frames, 'draws': self.draws, 'skipped': self.skipped}
@@ -0,0 +1,100 @@
+# resources.py
+import os
+import resource
+import sys
+import threading
+import time
+
+# --- CONFIGURATION ---
+CHECK_INTERVAL = 2.0  # seconds between file change checks per resource
+
+
+def file_signature(paths):
+    """(mtime_ns, size) of each existing path; changes whenever a file is rewritten"""
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append((path, None, None))
+    return tuple(sig)
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+class Resource:
+    """One lazily loaded object plus the files it was loaded from"""
+
+    def __init__(self, name, loader, paths):
+        self.name = name
+        self.loader = loader
+        self.paths = list(paths)
+        self.value = None
+        self.signature = None
+        self.loaded_at = None
+        self.checked_at = None
+        self.loads = 0
+        self.error = ""
+
+
+class ResourceRegistry:
+    """Process-wide cache of expensive objects (models) shared by all sessions.
+
+    get() loads a resource on first use and afterwards, at most every
+    CHECK_INTERVAL seconds, compares the signature of its files; when they
+    changed on disk it reloads them. A failed reload (e.g. a half-written
+    file) keeps serving the previous object and retries on the next check.
+    """
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.resources = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, paths):
+        """Declare `loader()` as the way to build `name` from `paths` (idempotent)"""
+        with self._lock:
+            if name not in self.resources:
+                self.resources[name] = Resource(name, loader, paths)
+
+    def get(self, name):
+        resource = self.resources[name]
+        now = time.monotonic()
+        if resource.checked_at is None or now - resource.checked_at >= self.check_interval:
+            with self._lock:
+                if resource.checked_at is None or now - resource.checked_at >= self.check_interval:
+                    resource.checked_at = now
+                    signature = file_signature(resource.paths)
+                    if resource.value is None or signature != resource.signature:
+                        self._load(resource, signature)
+        if resource.value is None:
+            raise RuntimeError(f"{name} could not be loaded: {resource.error}")
+        return resource.value
+
+    def status(self):
+        return {
+            name: {
+                'loaded': r.value is not None,
+                'loads': r.loads,
+                'loaded_at': r.loaded_at,
+                'error': r.error,
+            } for name, r in self.resources.items()
+        }
+
+    def _load(self, resource, signature):
+        try:
+            value = resource.loader()
+        except Exception as e:
+            resource.error = str(e)
+            return
+        # Swapping the reference is atomic; readers see the old or the new object
+        resource.value = value
+        resource.signature = signature
+        resource.loaded_at = time.strftime('%H:%M:%S')
+        resource.loads += 1
+        resource.error = ""
@@ -0,0 +1,449 @@
+# retention.py
+"""Segmented reading log with rotation, compression and retention.
+
+    python retention.py status          # manifest summary and disk use
+    python retention.py run             # one maintenance pass (rotate, gzip, expire, compact the store)
+    python retention.py import-csv data/gas_log.csv   # legacy CSV log -> one sealed segment
+
+The raw log is a directory of binlog segments instead of one file that
+grows forever. The active segment is rotated once it reaches SEGMENT_BYTES
+or SEGMENT_SECONDS; sealed segments are gzipped once they are cold, and
+expired by age and total size. manifest.json lists every segment with its
+time range, devices, row count and per-metric count/sum/min/max, so a
+reader only opens the segments overlapping its range and whole-history
+statistics need no segment at all.
+
+The same maintenance pass compacts the SQLite store: raw readings and fine
+rollups past their configured age are dropped, coarser rollups keep the
+long-range trends.
+"""
+import argparse
+import fcntl
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from binlog import HEADER_SIZE, RECORD, BinarySink, csv_to_binary, read_log, to_records
+from config import CONFIG_PATH, ConfigStore
+from storage import LEGACY_DEVICE, STORE_PATH, SensorStore
+
+# --- CONFIGURATION ---
+LOG_DIR = os.path.join('data', 'log')
+MANIFEST = 'manifest.json'
+WRITER_LOCK = 'writer.lock'        # flock held by the one process writing a log directory
+SEGMENT_BYTES = 64 * 1024 * 1024   # rotate the active segment at this size (~1M readings)...
+SEGMENT_SECONDS = 3600             # ...or after this long
+MAINTAIN_INTERVAL = 600            # seconds between background maintenance passes
+METRICS = ('gas', 'co', 'temp')
+
+
+def _stats(records):
+    """Per-metric count/sum/min/max of a RECORD array, for the manifest"""
+    out = {}
+    for m in METRICS:
+        values = records[m][np.isfinite(records[m])]
+        out[m] = {'count': int(len(values)), 'sum': float(values.sum()),
+                  'min': float(values.min()) if len(values) else None,
+                  'max': float(values.max()) if len(values) else None}
+    return out
+
+
+def _merge_stats(a, b):
+    out = {}
+    for m in METRICS:
+        x, y = a[m], b[m]
+        out[m] = {'count': x['count'] + y['count'], 'sum': x['sum'] + y['sum'],
+                  'min': min((v for v in (x['min'], y['min']) if v is not None), default=None),
+                  'max': max((v for v in (x['max'], y['max']) if v is not None), default=None)}
+    return out
+
+
+def _empty_stats():
+    return {m: {'count': 0, 'sum': 0.0, 'min': None, 'max': None} for m in METRICS}
+
+
+class SegmentLog:
+    """LogWriter sink writing rotating binlog segments, plus their reader.
+
+    Only the process running the sink writes the manifest (tmp + rename);
+    an instance only reads it, fresh on each query, until it first writes
+    or maintains the log. It then holds an flock on WRITER_LOCK until
+    close(), so a second writer (e.g. `retention.py run` next to the
+    dashboard) fails with RuntimeError instead of overwriting the
+    manifest. The active
+    segment's header count is authoritative, so readers see its rows as
+    soon as they are written even if the manifest lags by one fsync.
+    """
+
+    def __init__(self, path=LOG_DIR, segment_bytes=SEGMENT_BYTES, segment_seconds=SEGMENT_SECONDS):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.sink = None
+        self.active = None   # manifest entry of the segment being written
+        self._writes = False  # set once this instance writes; readers then use its own entries
+        self._lock_file = None
+        self._lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.segments = []
+        self.serial = 0
+
+    # --- LogWriter sink interface ---
+    def write(self, readings):
+        records = to_records(readings)
+        with self._lock:
+            self._take_over()
+            now = time.time()
+            if self.active is None or self._due(now):
+                self._rotate(now)
+            self.sink.append(records)
+            entry = self.active
+            ts = records['ts']
+            entry['start'] = min(entry['start'], float(ts.min())) if entry['count'] else float(ts.min())
+            entry['end'] = max(entry['end'], float(ts.max())) if entry['count'] else float(ts.max())
+            entry['count'] += len(records)
+            entry['bytes'] = HEADER_SIZE + self.sink.count * RECORD.itemsize
+            entry['devices'] = sorted(set(entry['devices']) | {d.decode() for d in np.unique(records['device'])})
+            entry['stats'] = _merge_stats(entry['stats'], _stats(records))
+
+    def fsync(self):
+        with self._lock:
+            if self.sink is not None:
+                self.sink.fsync()
+            self._save()
+
+    def close(self):
+        with self._lock:
+            if not self._writes:
+                return
+            self._seal()
+            self._save()
+            self._writes = False
+            self._lock_file.close()  # releases the flock
+            self._lock_file = None
+
+    # --- Maintenance ---
+    def claim(self):
+        """Become the log's writer now; raises RuntimeError if another process writes it"""
+        with self._lock:
+            self._take_over()
+
+    def maintain(self, retention, now=None):
+        """Rotate a stale active segment, gzip cold ones and expire old ones; returns what was done"""
+        now = time.time() if now is None else now
+        done = {'compressed': 0, 'deleted': 0}
+        with self._lock:
+            self._take_over()
+            if self.active is not None and self._due(now):
+                self._seal()
+            cold = now - retention['compress_after_hours'] * 3600
+            expired = now - retention['log_days'] * 86400
+            for entry in list(self.segments):
+                if entry['state'] == 'active':
+                    continue
+                if entry['end'] < expired:
+                    self._delete(entry)
+                    done['deleted'] += 1
+                elif entry['state'] == 'sealed' and entry['end'] < cold:
+                    self._compress(entry)
+                    done['compressed'] += 1
+            # Size cap: drop the oldest sealed segments beyond it
+            budget = retention['log_max_mb'] * 1024 * 1024
+            for entry in sorted(self.segments, key=lambda e: e['end']):
+                if sum(e['bytes'] for e in self.segments) <= budget:
+                    break
+                if entry['state'] != 'active':
+                    self._delete(entry)
+                    done['deleted'] += 1
+            self._save()
+        return done
+
+    def add_segment(self, path):
+        """Adopt a finished binlog file (e.g. from binlog.csv_to_binary) as a sealed segment"""
+        records = read_log(path)
+        if not len(records):
+            return None
+        with self._lock:
+            self._take_over()
+            name = self._name(records['ts'].min())
+            shutil.move(path, os.path.join(self.path, name))
+            records = read_log(os.path.join(self.path, name))
+            entry = self._entry(name, 'sealed', records)
+            self.segments.append(entry)
+            self._save()
+        return entry
+
+    # --- Reading ---
+    def load_manifest(self):
+        """Current segment entries: this process's own when it writes the log, else the file's"""
+        if not self._writes:
+            return self._read_manifest()['segments']
+        with self._lock:
+            return [dict(e) for e in self.segments]
+
+    def select(self, start=None, end=None, devices=None):
+        """Manifest entries that may hold readings with start <= ts < end from `devices`, oldest first"""
+        segments = self.load_manifest()
+        wanted = None if devices is None else set(devices)
+        out = []
+        for entry in sorted(segments, key=lambda e: e['start']):
+            if start is not None and entry['end'] < start and entry['state'] != 'active':
+                continue
+            if end is not None and entry['start'] >= end:
+                continue
+            if wanted is not None and entry['state'] != 'active' and not wanted & set(entry['devices']):
+                continue
+            out.append(entry)
+        return out
+
+    def read(self, start=None, end=None, devices=None):
+        """Yield RECORD arrays of the readings in range, one per segment opened"""
+        wanted = None if devices is None else np.array([str(d).encode() for d in devices])
+        for entry in self.select(start, end, devices):
+            try:
+                records = self._load(entry)
+            except FileNotFoundError:
+                continue  # expired or compressed since the manifest was read
+            keep = np.ones(len(records), dtype=bool)
+            if start is not None:
+                keep &= records['ts'] >= start
+            if end is not None:
+                keep &= records['ts'] < end
+            if wanted is not None:
+                keep &= np.isin(records['device'], wanted)
+            if keep.any():
+                yield records[keep]
+
+    def summary(self):
+        """{metric: {'min', 'max', 'mean', 'count'}} over every retained segment, from the manifest alone"""
+        total = _empty_stats()
+        for entry in self.load_manifest():
+            total = _merge_stats(total, entry['stats'])
+        return {m: {'min': s['min'], 'max': s['max'], 'mean': s['sum'] / s['count'] if s['count'] else None,
+                    'count': s['count']} for m, s in total.items()}
+
+    def status(self):
+        segments = self.load_manifest()
+        return {
+            'segments': len(segments),
+            'compressed': sum(e['state'] == 'compressed' for e in segments),
+            'rows': sum(e['count'] for e in segments),
+            'disk_mb': round(sum(e['bytes'] for e in segments) / 1024 ** 2, 1),
+            'first': min((e['start'] for e in segments), default=None),
+            'last': max((e['end'] for e in segments), default=None),
+        }
+
+    # --- Internals (called with the lock held) ---
+    def _take_over(self):
+        """Become the writer: reload the manifest and seal a segment a previous writer left open"""
+        if self._writes:
+            return
+        lock_file = open(os.path.join(self.path, WRITER_LOCK), 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.seek(0)
+            holder = lock_file.read().strip() or "?"
+            lock_file.close()
+            raise RuntimeError(f"{self.path} is being written by another process (pid {holder})") from None
+        lock_file.truncate(0)
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._lock_file = lock_file
+        self._writes = True
+        manifest = self._read_manifest()
+        self.segments = manifest['segments']
+        self.serial = manifest['next']
+        for i, entry in enumerate(self.segments):
+            if entry['state'] != 'active':
+                continue
+            # Its header count is final; the manifest stats may lag behind it
+            records = read_log(self._file(entry))
+            if len(records):
+                self.segments[i] = self._entry(entry['name'], 'sealed', records)
+            else:
+                entry['count'] = 0
+                os.remove(self._file(entry))
+        self.segments = [e for e in self.segments if e['count']]
+
+    def _due(self, now):
+        return self.sink.count * RECORD.itemsize >= self.segment_bytes or now - self.active['opened'] >= self.segment_seconds
+
+    def _rotate(self, now):
+        self._seal()
+        name = self._name(now)
+        self.sink = BinarySink(os.path.join(self.path, name))
+        self.active = {'name': name, 'state': 'active', 'opened': now, 'start': now, 'end': now, 'count': 0,
+                       'bytes': HEADER_SIZE, 'devices': [], 'stats': _empty_stats()}
+        self.segments.append(self.active)
+        self._save()
+
+    def _seal(self):
+        if self.sink is None:
+            return
+        self.sink.close()
+        self.sink = None
+        if self.active['count'] == 0:
+            self.segments.remove(self.active)
+            os.remove(self._file(self.active))
+        else:
+            self.active['state'] = 'sealed'
+        self.active = None
+
+    def _compress(self, entry):
+        src = self._file(entry)
+        dst = src + '.gz'
+        with open(src, 'rb') as f_in, gzip.open(dst + '.tmp', 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(dst + '.tmp', dst)
+        entry['state'] = 'compressed'
+        entry['bytes'] = os.path.getsize(dst)
+        self._save()  # point readers at the .gz before the original goes away
+        os.remove(src)
+
+    def _delete(self, entry):
+        self.segments.remove(entry)
+        self._save()
+        try:
+            os.remove(self._file(entry))
+        except FileNotFoundError:
+            pass
+
+    def _entry(self, name, state, records):
+        return {'name': name, 'state': state, 'opened': float(records['ts'].min()),
+                'start': float(records['ts'].min()), 'end': float(records['ts'].max()), 'count': len(records),
+                'bytes': HEADER_SIZE + len(records) * RECORD.itemsize,
+                'devices': sorted(d.decode() for d in np.unique(records['device'])), 'stats': _stats(records)}
+
+    def _name(self, ts):
+        self.serial += 1
+        return f"seg-{int(ts)}-{self.serial:06d}.bin"
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': 1, 'next': 0, 'segments': []}
+
+    def _file(self, entry):
+        path = os.path.join(self.path, entry['name'])
+        return path + '.gz' if entry['state'] == 'compressed' else path
+
+    def _load(self, entry):
+        path = self._file(entry)
+        if entry['state'] != 'compressed':
+            return read_log(path)
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+        return np.frombuffer(data, dtype=RECORD, offset=HEADER_SIZE)
+
+    def _save(self):
+        tmp = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': 1, 'next': self.serial, 'segments': self.segments}, f)
+        os.replace(tmp, os.path.join(self.path, MANIFEST))
+
+
+def compact_store(store, retention, now=None):
+    """Apply the store part of the retention settings; returns rows deleted per table"""
+    now = time.time() if now is None else now
+    return store.compact(raw_before=now - retention['raw_days'] * 86400,
+                         rollups_before={1: now - retention['second_rollup_days'] * 86400,
+                                         60: now - retention['minute_rollup_days'] * 86400})
+
+
+class RetentionService:
+    """Runs SegmentLog.maintain() and compact_store() every MAINTAIN_INTERVAL on its own thread.
+
+    `get_retention` is called on every pass, so edited retention settings
+    apply from the next one.
+    """
+
+    def __init__(self, log, store, get_retention, interval=MAINTAIN_INTERVAL):
+        self.log = log
+        self.store = store
+        self.get_retention = get_retention
+        self.interval = interval
+        self.passes = 0
+        self.last = {}
+        self.last_error = ""
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def run_once(self):
+        started = time.perf_counter()
+        retention = self.get_retention()
+        done = self.log.maintain(retention)
+        done['store'] = compact_store(self.store, retention)
+        done['ms'] = round((time.perf_counter() - started) * 1000, 1)
+        self.passes += 1
+        self.last = done
+        return done
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def stats(self):
+        return {'passes': self.passes, 'last': self.last, 'error': self.last_error, **self.log.status()}
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+            if self._stop.wait(self.interval):
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sensor log rotation and retention")
+    parser.add_argument('--log-dir', default=LOG_DIR)
+    parser.add_argument('--store', default=STORE_PATH)
+    parser.add_argument('--config', default=CONFIG_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="show the segment manifest summary")
+    sub.add_parser('run', help="run one maintenance pass now")
+    imp = sub.add_parser('import-csv', help="convert a legacy CSV log into a sealed segment")
+    imp.add_argument('csv')
+    imp.add_argument('--device', default=LEGACY_DEVICE)
+    args = parser.parse_args()
+
+    log = SegmentLog(args.log_dir)
+    started = time.time()
+    if args.command == 'status':
+        print(json.dumps(log.status(), indent=2))
+        return
+    try:
+        log.claim()  # before any work, so a running dashboard is not raced
+    except RuntimeError as e:
+        raise SystemExit(f"❌ {e}; stop the dashboard first (it runs these passes itself)") from None
+    try:
+        if args.command == 'run':
+            retention = ConfigStore(args.config).get().retention
+            done = log.maintain(retention)
+            store = SensorStore(args.store)
+            done['store'] = compact_store(store, retention)
+            store.close()
+            print(json.dumps(done, indent=2))
+            print(f"✅ Maintenance pass done in {time.time() - started:.1f}s")
+        elif args.command == 'import-csv':
+            tmp = os.path.join(args.log_dir, 'import.bin.tmp')
+            n = csv_to_binary(args.csv, tmp, args.device)
+            log.add_segment(tmp)
+            print(f"✅ Imported {n} readings into {args.log_dir} in {time.time() - started:.1f}s")
+    finally:
+        log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# ring.py
+import numpy as np
+
+# --- CONFIGURATION ---
+COLUMNS = ('ts', 'lat', 'lon', 'co', 'gas', 'temp')
+COL = {name: i for i, name in enumerate(COLUMNS)}
+CAPACITY = 4096  # readings kept per device (~30 min at 2 Hz)
+
+
+def to_columns(readings):
+    """Reading dicts as produced by IngestService -> (n, len(COLUMNS)) float array"""
+    return np.array([(r['time'].timestamp(), np.nan if r['lat'] is None else r['lat'],
+                      np.nan if r['lng'] is None else r['lng'], r['co'], r['gas'], r['temp'])
+                     for r in readings], dtype=float)
+
+
+class ReadingRing:
+    """Fixed-capacity ring of readings stored as one float64 array of COLUMNS.
+
+    Every row is written twice, at i and i + capacity, so the latest n
+    rows (n <= capacity) are always one contiguous slice and window()
+    returns a view instead of a copy. A view stays valid until another
+    capacity - n rows have been appended; copy it to keep it longer.
+    Appends are vectorized and allocate nothing.
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.data = np.full((2 * capacity, len(COLUMNS)), np.nan)
+        self.head = 0    # next write position in [0, capacity)
+        self.count = 0   # total rows ever appended
+
+    def append(self, rows):
+        """Append an (n, len(COLUMNS)) array of rows, oldest first"""
+        rows = np.asarray(rows, dtype=float)
+        if len(rows) > self.capacity:
+            self.count += len(rows) - self.capacity
+            rows = rows[-self.capacity:]
+        n = len(rows)
+        first = min(n, self.capacity - self.head)
+        for offset in (0, self.capacity):
+            self.data[offset + self.head:offset + self.head + first] = rows[:first]
+            self.data[offset:offset + n - first] = rows[first:]
+        self.head = (self.head + n) % self.capacity
+        self.count += n
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def window(self, n=None):
+        """Zero-copy (n, len(COLUMNS)) view of the latest n rows, oldest first"""
+        n = len(self) if n is None else min(n, len(self))
+        end = self.head + self.capacity
+        return self.data[end - n:end]
@@ -0,0 +1,218 @@
+# rules.py
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from ring import COL
+
+# --- CONFIGURATION ---
+METRICS = ('gas', 'co', 'temp')
+LEVELS = ('SAFE', 'WARNING', 'DANGER')
+RATE_LIMITS = (200.0, 50.0, 2.0)  # gas/co ppm per second, °C per second
+WINDOW = 60                        # readings per device in the rolling z-score window
+MIN_SAMPLES = 20                   # no anomaly verdicts on a window shorter than this
+Z_LIMIT = 4.0
+RECENT_ALERTS = 200
+
+
+def threshold_levels(values, thresholds):
+    """(n, 3) values -> (n, 3) level indices into LEVELS, 0 SAFE .. 2 DANGER"""
+    safe = np.array([t[0] for t in thresholds], dtype=float)
+    warning = np.array([t[1] for t in thresholds], dtype=float)
+    values = np.asarray(values, dtype=float)
+    return (values > safe).astype(np.int8) + (values > warning)
+
+
+class Alert:
+    """One rule firing for one metric of one reading"""
+
+    __slots__ = ('ts', 'device', 'metric', 'kind', 'level', 'value', 'limit')
+
+    def __init__(self, ts, device, metric, kind, level, value, limit):
+        self.ts = ts
+        self.device = device
+        self.metric = metric
+        self.kind = kind      # 'threshold', 'rate' or 'anomaly'
+        self.level = level    # 'WARNING' or 'DANGER'
+        self.value = value    # reading, rate per second or z-score, depending on kind
+        self.limit = limit
+
+    def as_dict(self):
+        return {
+            'time': datetime.fromtimestamp(self.ts),
+            'device': self.device,
+            'metric': self.metric,
+            'kind': self.kind,
+            'level': self.level,
+            'value': round(self.value, 2),
+            'limit': round(self.limit, 2),
+        }
+
+    def __repr__(self):
+        return f"Alert({self.device!r}, {self.metric}, {self.kind}, {self.level}, {self.value:.2f})"
+
+
+class RulesEngine:
+    """Threshold, rate-of-change and rolling z-score rules over reading batches.
+
+    Per-device state lives in NumPy arrays indexed by a device slot: a ring
+    of the last `window` values plus its running sum and sum of squares, so
+    each sample costs O(1) whatever the window. A batch is evaluated in
+    rounds, one per reading of the busiest device, and every round is a
+    handful of vectorized operations over all devices present in it.
+
+    `get_thresholds` is called once per batch, so edited thresholds apply
+    from the next batch on.
+    """
+
+    def __init__(self, get_thresholds, rate_limits=RATE_LIMITS, window=WINDOW, z_limit=Z_LIMIT,
+                 min_samples=MIN_SAMPLES, capacity=64):
+        self.get_thresholds = get_thresholds
+        self.rate_limits = np.asarray(rate_limits, dtype=float)
+        self.window = window
+        self.z_limit = z_limit
+        self.min_samples = min_samples
+        self.slots = {}
+        self.names = []
+        k = len(METRICS)
+        self.ring = np.zeros((capacity, window, k))
+        self.head = np.zeros(capacity, dtype=np.int64)
+        self.filled = np.zeros(capacity, dtype=np.int64)
+        self.sum = np.zeros((capacity, k))
+        self.sumsq = np.zeros((capacity, k))
+        self.last_value = np.zeros((capacity, k))
+        self.last_ts = np.full(capacity, np.nan)
+        self.level = np.zeros((capacity, k), dtype=np.int8)
+        self.recent = deque(maxlen=RECENT_ALERTS)
+        self.listeners = []
+        self.evaluated = 0
+        self.fired = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Call `callback(alerts)` with every non-empty list of new alerts"""
+        self.listeners.append(callback)
+
+    def evaluate_columns(self, devices, columns):
+        """IngestService column listener: evaluate an (n, len(ring.COLUMNS)) batch"""
+        return self.evaluate_arrays(devices, columns[:, COL['ts']], columns[:, [COL[m] for m in METRICS]])
+
+    def evaluate_arrays(self, devices, ts, values):
+        """Evaluate n readings given as device ids, epoch seconds and (n, 3) gas/co/temp"""
+        started = time.perf_counter()
+        ts = np.asarray(ts, dtype=float)
+        values = np.asarray(values, dtype=float).reshape(len(ts), len(METRICS))
+        thresholds = np.array(self.get_thresholds(), dtype=float)
+        alerts = []
+        with self._lock:
+            slots = np.array([self._slot(d) for d in devices], dtype=np.int64)
+            for idx in self._rounds(slots):
+                alerts.extend(self._round(slots[idx], ts[idx], values[idx], thresholds))
+            self.evaluated += len(ts)
+            self.fired += len(alerts)
+            self.recent.extend(alerts)
+            self.busy += time.perf_counter() - started
+        if alerts:
+            for callback in self.listeners:
+                callback(alerts)
+        return alerts
+
+    def status(self, device):
+        """Current threshold level name per metric for a device, or None if unseen"""
+        with self._lock:
+            slot = self.slots.get(device)
+            if slot is None:
+                return None
+            return {m: LEVELS[lvl] for m, lvl in zip(METRICS, self.level[slot].tolist())}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'devices': len(self.slots),
+                'evaluated': self.evaluated,
+                'alerts': self.fired,
+                'us_per_reading': round(self.busy / self.evaluated * 1e6, 2) if self.evaluated else 0.0,
+            }
+
+    def _rounds(self, slots):
+        """Split a batch into index groups where each device appears at most once, in arrival order"""
+        n = len(slots)
+        order = np.argsort(slots, kind='stable')
+        ordered = slots[order]
+        starts = np.r_[True, ordered[1:] != ordered[:-1]]
+        first = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n) - first
+        by_rank = np.argsort(rank, kind='stable')
+        bounds = np.searchsorted(rank[by_rank], np.arange(rank.max() + 2))
+        return [by_rank[bounds[k]:bounds[k + 1]] for k in range(len(bounds) - 1)]
+
+    def _round(self, s, ts, v, thresholds):
+        # Thresholds
+        level = threshold_levels(v, thresholds)
+        self.level[s] = level
+
+        # Rate of change against the device's previous reading
+        dt = ts - self.last_ts[s]
+        has_prev = np.isfinite(dt) & (dt > 0)
+        rate = np.zeros_like(v)
+        rate[has_prev] = (v[has_prev] - self.last_value[s[has_prev]]) / dt[has_prev, None]
+        too_fast = np.abs(rate) > self.rate_limits
+
+        # Rolling z-score against the window before this reading
+        n = self.filled[s][:, None].astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = self.sum[s] / n
+            std = np.sqrt(np.maximum(self.sumsq[s] / n - mean ** 2, 0.0))
+            z = (v - mean) / std
+        anomalous = (n >= self.min_samples) & (std > 1e-9) & (np.abs(z) > self.z_limit)
+
+        # Fold the reading into the window
+        pos = self.head[s]
+        full = self.filled[s] == self.window
+        old = self.ring[s, pos]
+        self.sum[s] += v - np.where(full[:, None], old, 0.0)
+        self.sumsq[s] += v ** 2 - np.where(full[:, None], old ** 2, 0.0)
+        self.ring[s, pos] = v
+        self.head[s] = (pos + 1) % self.window
+        self.filled[s] = np.minimum(self.filled[s] + 1, self.window)
+        self.last_value[s] = v
+        self.last_ts[s] = ts
+
+        alerts = []
+        for i, m in zip(*np.nonzero(level > 0)):
+            alerts.append(Alert(float(ts[i]), self.names[s[i]], METRICS[m], 'threshold', LEVELS[level[i, m]],
+                                float(v[i, m]), float(thresholds[m, level[i, m] - 1])))
+        for i, m in zip(*np.nonzero(too_fast)):
+            alerts.append(Alert(float(ts[i]), self.names[s[i]], METRICS[m], 'rate', 'WARNING',
+                                float(rate[i, m]), float(self.rate_limits[m])))
+        for i, m in zip(*np.nonzero(anomalous)):
+            alerts.append(Alert(float(ts[i]), self.names[s[i]], METRICS[m], 'anomaly', 'WARNING',
+                                float(z[i, m]), self.z_limit))
+        return alerts
+
+    def _slot(self, device):
+        slot = self.slots.get(device)
+        if slot is None:
+            slot = len(self.names)
+            if slot == len(self.head):
+                self._grow()
+            self.slots[device] = slot
+            self.names.append(device)
+        return slot
+
+    def _grow(self):
+        extra = len(self.head)
+        k = len(METRICS)
+        self.ring = np.concatenate([self.ring, np.zeros((extra, self.window, k))])
+        self.head = np.concatenate([self.head, np.zeros(extra, dtype=np.int64)])
+        self.filled = np.concatenate([self.filled, np.zeros(extra, dtype=np.int64)])
+        self.sum = np.concatenate([self.sum, np.zeros((extra, k))])
+        self.sumsq = np.concatenate([self.sumsq, np.zeros((extra, k))])
+        self.last_value = np.concatenate([self.last_value, np.zeros((extra, k))])
+        self.last_ts = np.concatenate([self.last_ts, np.full(extra, np.nan)])
+        self.level = np.concatenate([self.level, np.zeros((extra, k), dtype=np.int8)])
@@ -0,0 +1,130 @@
+# spatial.py
+import threading
+
+import numpy as np
+
+# --- CONFIGURATION ---
+LEVELS = range(6, 23)   # level b splits 360° into 2**b cells (level 22 ≈ 9.5 m)
+BLOCK_BITS = 6          # cells are indexed in 64 x 64 blocks for viewport lookups
+METRICS = ('gas', 'co', 'temp')
+
+
+def level_for_zoom(zoom):
+    """Grid level whose cells are ~4 px wide on a 256 px web map tile at `zoom`"""
+    return min(max(zoom + 6, LEVELS[0]), LEVELS[-1])
+
+
+def cell_coords(lat, lon, level):
+    """Integer (row, col) of the cell containing each point"""
+    size = 360.0 / 2 ** level
+    row = np.floor((np.asarray(lat, dtype=float) + 90.0) / size).astype(np.int64)
+    col = np.floor((np.asarray(lon, dtype=float) + 180.0) / size).astype(np.int64)
+    return row, col
+
+
+class GridLevel:
+    """Per-cell count / sum / max of every metric at one grid level"""
+
+    def __init__(self, level, capacity=1024):
+        self.level = level
+        self.size = 360.0 / 2 ** level
+        self.n = 0
+        self.slots = {}    # cell id -> row in the arrays below
+        self.blocks = {}   # block id -> list of slots
+        self.lat = np.empty(capacity)
+        self.lon = np.empty(capacity)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.sum = np.zeros((capacity, len(METRICS)))
+        self.max = np.full((capacity, len(METRICS)), -np.inf)
+
+    def add(self, lat, lon, values):
+        row, col = cell_coords(lat, lon, self.level)
+        ids, inverse = np.unique(row * 2 ** self.level + col, return_inverse=True)
+        slot_of = np.empty(len(ids), dtype=np.int64)
+        for i, cell_id in enumerate(ids.tolist()):
+            slot = self.slots.get(cell_id)
+            if slot is None:
+                slot = self._new_cell(cell_id)
+            slot_of[i] = slot
+        slots = slot_of[inverse]
+        np.add.at(self.count, slots, 1)
+        np.add.at(self.sum, slots, values)
+        np.maximum.at(self.max, slots, values)
+
+    def query(self, south, west, north, east):
+        """Slots of the cells whose centre lies inside the box"""
+        r0, c0 = cell_coords(south, west, self.level)
+        r1, c1 = cell_coords(north, east, self.level)
+        found = []
+        for br in range(int(r0) >> BLOCK_BITS, (int(r1) >> BLOCK_BITS) + 1):
+            for bc in range(int(c0) >> BLOCK_BITS, (int(c1) >> BLOCK_BITS) + 1):
+                found.extend(self.blocks.get((br, bc), ()))
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        slots = np.array(found, dtype=np.int64)
+        inside = ((self.lat[slots] >= south) & (self.lat[slots] <= north)
+                  & (self.lon[slots] >= west) & (self.lon[slots] <= east))
+        return slots[inside]
+
+    def _new_cell(self, cell_id):
+        if self.n == len(self.lat):
+            self._grow()
+        slot = self.n
+        self.n += 1
+        row, col = divmod(cell_id, 2 ** self.level)
+        self.lat[slot] = (row + 0.5) * self.size - 90.0
+        self.lon[slot] = (col + 0.5) * self.size - 180.0
+        self.slots[cell_id] = slot
+        self.blocks.setdefault((row >> BLOCK_BITS, col >> BLOCK_BITS), []).append(slot)
+        return slot
+
+    def _grow(self):
+        extra = len(self.lat)
+        self.lat = np.concatenate([self.lat, np.empty(extra)])
+        self.lon = np.concatenate([self.lon, np.empty(extra)])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.sum = np.concatenate([self.sum, np.zeros((extra, len(METRICS)))])
+        self.max = np.concatenate([self.max, np.full((extra, len(METRICS)), -np.inf)])
+
+
+class SpatialGrid:
+    """Multi-level grid aggregating every reading ever seen, updated per batch.
+
+    Each level keeps one row per visited cell, so memory grows with the
+    area covered rather than the number of readings, and a viewport query
+    at the level matching the map zoom touches a bounded number of cells.
+    """
+
+    def __init__(self, levels=LEVELS):
+        self.levels = {b: GridLevel(b) for b in levels}
+        self.readings = 0
+        self._lock = threading.Lock()
+
+    def add(self, lat, lon, values):
+        """Fold arrays of positions and (n, 3) gas/co/temp values into every level"""
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        values = np.asarray(values, dtype=float).reshape(len(lat), len(METRICS))
+        ok = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(values).all(axis=1)
+        if not ok.any():
+            return
+        with self._lock:
+            for grid in self.levels.values():
+                grid.add(lat[ok], lon[ok], values[ok])
+            self.readings += int(ok.sum())
+
+    def query(self, level, south, west, north, east, metric, stat='max'):
+        """(lat, lon, value) of the occupied cells in a box; stat is 'max' or 'mean'"""
+        m = METRICS.index(metric)
+        with self._lock:
+            grid = self.levels[level]
+            slots = grid.query(south, west, north, east)
+            if stat == 'mean':
+                value = grid.sum[slots, m] / grid.count[slots]
+            else:
+                value = grid.max[slots, m]
+            return grid.lat[slots].copy(), grid.lon[slots].copy(), value
+
+    def stats(self):
+        with self._lock:
+            return {'readings': self.readings, 'cells': {b: g.n for b, g in self.levels.items()}}
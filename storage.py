@@ -0,0 +1,296 @@
+# storage.py
+"""Indexed SQLite store for sensor readings.
+
+    python storage.py migrate data/gas_log.csv   # import a legacy CSV log
+    python storage.py rebuild-rollups            # recompute trend rollups from the raw readings kept
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from downsample import METRICS, ROLLUPS, as_series, local_times, pick_resolution, rebucket, with_time
+
+# --- CONFIGURATION ---
+STORE_PATH = os.path.join('data', 'safesight.db')
+LEGACY_DEVICE = 'legacy'
+LEGACY_INTERVAL = 0.5  # assumed spacing of legacy CSV rows (seconds)
+COLUMNS = ['ts', 'device_id', 'lat', 'lon', 'co', 'gas', 'temp']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    ts REAL NOT NULL,
+    device_id TEXT NOT NULL,
+    lat REAL,
+    lon REAL,
+    co INTEGER,
+    gas INTEGER,
+    temp REAL
+);
+CREATE INDEX IF NOT EXISTS idx_readings_ts ON readings (ts);
+CREATE INDEX IF NOT EXISTS idx_readings_device_ts ON readings (device_id, ts);
+"""
+
+# One table per bucket width, keyed by (bucket start, device)
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_{w} (
+    bucket REAL NOT NULL,
+    device_id TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    co_sum REAL, co_min REAL, co_max REAL,
+    gas_sum REAL, gas_min REAL, gas_max REAL,
+    temp_sum REAL, temp_min REAL, temp_max REAL,
+    PRIMARY KEY (bucket, device_id)
+);
+"""
+
+# Folds the readings matching {where} into rollup_{w}; runs entirely inside SQLite
+ROLLUP_UPSERT = """
+INSERT INTO rollup_{w}
+SELECT CAST(ts / {w} AS INTEGER) * {w} AS b, device_id, COUNT(*),
+       SUM(co), MIN(co), MAX(co), SUM(gas), MIN(gas), MAX(gas), SUM(temp), MIN(temp), MAX(temp)
+FROM readings WHERE {where} GROUP BY b, device_id
+ON CONFLICT (bucket, device_id) DO UPDATE SET
+    n = n + excluded.n,
+    co_sum = co_sum + excluded.co_sum, co_min = MIN(co_min, excluded.co_min), co_max = MAX(co_max, excluded.co_max),
+    gas_sum = gas_sum + excluded.gas_sum, gas_min = MIN(gas_min, excluded.gas_min), gas_max = MAX(gas_max, excluded.gas_max),
+    temp_sum = temp_sum + excluded.temp_sum, temp_min = MIN(temp_min, excluded.temp_min), temp_max = MAX(temp_max, excluded.temp_max)
+"""
+
+
+class SensorStore:
+    """Readings table indexed by time and by (device, time).
+
+    Every insert also folds the batch into the rollup tables (see
+    downsample.ROLLUPS), so trend queries over long ranges read a bounded
+    number of pre-aggregated buckets instead of raw rows.
+
+    Writes go through one connection guarded by a lock (the LogWriter thread
+    is the only writer); every query opens its own short-lived connection so
+    readers never block on each other under WAL.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        for width in ROLLUPS:
+            self.conn.executescript(ROLLUP_SCHEMA.format(w=width))
+        self._lock = threading.Lock()
+
+    # --- LogWriter sink interface ---
+    def write(self, readings):
+        rows = [(r['time'].timestamp(), r['device'], r['lat'], r['lng'], r['co'], r['gas'], r['temp']) for r in readings]
+        self.insert_rows(rows)
+
+    def fsync(self):
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def insert_rows(self, rows):
+        """Insert (ts, device_id, lat, lon, co, gas, temp) tuples in one transaction"""
+        if not rows:
+            return
+        with self._lock:
+            with self.conn:
+                last = self.conn.execute("SELECT IFNULL(MAX(rowid), 0) FROM readings").fetchone()[0]
+                self.conn.executemany("INSERT INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                for width in ROLLUPS:
+                    self.conn.execute(ROLLUP_UPSERT.format(w=width, where="rowid > ?"), (last,))
+
+    def rebuild_rollups(self):
+        """Recompute the rollup buckets that the raw readings still cover.
+
+        Buckets older than the oldest raw reading (and the one straddling it)
+        may summarize rows compact() has since dropped; they are kept as they are.
+        """
+        with self._lock:
+            with self.conn:
+                first = self.conn.execute("SELECT MIN(ts) FROM readings").fetchone()[0]
+                if first is None:
+                    return
+                for width in ROLLUPS:
+                    start = -(-first // width) * width  # first bucket wholly inside the raw history
+                    self.conn.execute(f"DELETE FROM rollup_{width} WHERE bucket >= ?", (start,))
+                    self.conn.execute(ROLLUP_UPSERT.format(w=width, where="ts >= ?"), (start,))
+
+    def compact(self, raw_before=None, rollups_before=None):
+        """Drop raw readings older than `raw_before` and rollup buckets older than
+        `rollups_before[width]`; returns {table: rows deleted}.
+
+        Every reading is already folded into the rollups on insert, so trends
+        over old ranges keep working from the coarser tables. Freed pages are
+        reused by new rows, so the file stops growing once retention kicks in.
+        """
+        deleted = {}
+        with self._lock:
+            with self.conn:
+                if raw_before is not None:
+                    deleted['readings'] = self.conn.execute("DELETE FROM readings WHERE ts < ?", (raw_before,)).rowcount
+                for width, before in (rollups_before or {}).items():
+                    if before is not None:
+                        deleted[f'rollup_{width}'] = self.conn.execute(
+                            f"DELETE FROM rollup_{width} WHERE bucket < ?", (before,)).rowcount
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    # --- Queries ---
+    def query(self, start=None, end=None, devices=None):
+        """Readings with start <= ts < end as a DataFrame, oldest first"""
+        where, params = _range_clause(start, end, devices)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM readings{where} ORDER BY ts"
+        with sqlite3.connect(self.path) as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        df['time'] = local_times(df['ts'])
+        return df
+
+    def query_trend(self, start=None, end=None, devices=None, max_points=1000):
+        """Downsampled co/gas/temp series for a chart about `max_points` pixels wide.
+
+        Returns at most max_points rows with ts/time, n and <m>, <m>_min,
+        <m>_max for each metric, read from the coarsest rollup that still
+        gives one bucket per point (raw rows for short spans).
+        """
+        lo, hi = self.time_bounds()
+        if lo is None:
+            return with_time(as_series(pd.DataFrame(columns=['ts', *METRICS])))
+        # Only the part of the range that holds data counts towards the resolution
+        span = min(end if end is not None else hi, hi) - max(start if start is not None else lo, lo)
+        width = pick_resolution(span, max_points)
+        if width == 0:
+            where, params = _range_clause(start, end, devices)
+            sql = f"SELECT ts, {', '.join(METRICS)} FROM readings{where} ORDER BY ts"
+            with sqlite3.connect(self.path) as conn:
+                df = as_series(pd.read_sql_query(sql, conn, params=params))
+        else:
+            where, params = _range_clause(start, end, devices, ts_column='bucket')
+            cols = ", ".join(f"SUM({m}_sum) / SUM(n) AS {m}, MIN({m}_min) AS {m}_min, MAX({m}_max) AS {m}_max" for m in METRICS)
+            sql = (f"SELECT bucket AS ts, SUM(n) AS n, {cols} FROM rollup_{width}"
+                   f"{where} GROUP BY bucket ORDER BY bucket")
+            with sqlite3.connect(self.path) as conn:
+                df = pd.read_sql_query(sql, conn, params=params)
+        return with_time(rebucket(df, max_points))
+
+    def iter_locations(self, end=None, chunksize=200000):
+        """Yield (lat, lon, [gas, co, temp]) arrays of located readings before `end`, chunk by chunk"""
+        where, params = _range_clause(None, end, None)
+        where += (" AND" if where else " WHERE") + " lat IS NOT NULL AND lon IS NOT NULL"
+        sql = f"SELECT lat, lon, gas, co, temp FROM readings{where}"
+        with sqlite3.connect(self.path) as conn:
+            for chunk in pd.read_sql_query(sql, conn, params=params, chunksize=chunksize):
+                yield chunk['lat'].to_numpy(), chunk['lon'].to_numpy(), chunk[['gas', 'co', 'temp']].to_numpy(dtype=float)
+
+    def iter_buckets(self, width=1, start=None, end=None, devices=None, chunksize=500000):
+        """Yield DataFrames of (ts, device_id, gas, co, temp) bucket means from rollup_{width}, oldest first"""
+        where, params = _range_clause(start, end, devices, ts_column='bucket')
+        sql = (f"SELECT bucket AS ts, device_id, gas_sum / n AS gas, co_sum / n AS co, temp_sum / n AS temp "
+               f"FROM rollup_{width}{where} ORDER BY bucket")
+        with sqlite3.connect(self.path) as conn:
+            yield from pd.read_sql_query(sql, conn, params=params, chunksize=chunksize)
+
+    def devices(self):
+        with sqlite3.connect(self.path) as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT device_id FROM readings")]
+
+    def has_device(self, device):
+        """True if the store holds readings or rollups of `device`"""
+        with sqlite3.connect(self.path) as conn:
+            return any(conn.execute(f"SELECT 1 FROM {table} WHERE device_id = ? LIMIT 1", (device,)).fetchone()
+                       for table in ('readings', f'rollup_{ROLLUPS[-1]}'))
+
+    def time_bounds(self):
+        """(first_ts, last_ts), or (None, None) when empty; includes history only kept as rollups"""
+        with sqlite3.connect(self.path) as conn:
+            lo, hi = conn.execute("SELECT MIN(ts), MAX(ts) FROM readings").fetchone()
+            first, last = conn.execute(f"SELECT MIN(bucket), MAX(bucket) FROM rollup_{ROLLUPS[-1]}").fetchone()
+        if first is not None and (lo is None or first < lo):
+            lo = first
+        if hi is None:
+            hi = last
+        return lo, hi
+
+
+def _range_clause(start, end, devices, ts_column='ts'):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{ts_column} >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append(f"{ts_column} < ?")
+        params.append(end)
+    if devices:
+        clauses.append(f"device_id IN ({', '.join('?' * len(devices))})")
+        params.extend(devices)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def migrate_csv(csv_path, store, device=LEGACY_DEVICE, chunksize=100000):
+    """Import a legacy `lat,lon,co,gas,temp` CSV log into the store.
+
+    The old format has no timestamps, so rows are spaced LEGACY_INTERVAL
+    apart ending at the file's modification time. Those timestamps change
+    with the file, so rows cannot be matched up again: a device that already
+    has data in the store raises ValueError instead of importing twice.
+    """
+    if store.has_device(device):
+        raise ValueError(f"{store.path} already holds readings for {device!r}")
+    with open(csv_path) as f:
+        total = sum(1 for _ in f) - 1
+    end = os.path.getmtime(csv_path)
+    first_ts = end - max(total - 1, 0) * LEGACY_INTERVAL
+    imported = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk = chunk.dropna(subset=['co', 'gas', 'temp'])
+        ts = first_ts + (chunk.index.to_numpy() * LEGACY_INTERVAL)
+        rows = zip(ts.tolist(), [device] * len(chunk),
+                   chunk['lat'].tolist(), chunk['lon'].tolist(),
+                   chunk['co'].astype(int).tolist(), chunk['gas'].astype(int).tolist(),
+                   chunk['temp'].astype(float).tolist())
+        store.insert_rows(list(rows))
+        imported += len(chunk)
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SafeSight sensor store")
+    sub = parser.add_subparsers(dest='command', required=True)
+    migrate = sub.add_parser('migrate', help="import a legacy CSV log")
+    migrate.add_argument('csv')
+    migrate.add_argument('--store', default=STORE_PATH)
+    migrate.add_argument('--device', default=LEGACY_DEVICE)
+    rebuild = sub.add_parser('rebuild-rollups', help="recompute the trend rollups still covered by raw readings")
+    rebuild.add_argument('--store', default=STORE_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        store = SensorStore(args.store)
+        started = time.time()
+        try:
+            n = migrate_csv(args.csv, store, args.device)
+        except ValueError as e:
+            raise SystemExit(f"❌ {e}; pass another --device to import it anyway") from None
+        finally:
+            store.close()
+        print(f"✅ Imported {n} readings into {args.store} in {time.time() - started:.1f}s")
+    elif args.command == 'rebuild-rollups':
+        store = SensorStore(args.store)
+        started = time.time()
+        store.rebuild_rollups()
+        store.close()
+        print(f"✅ Rebuilt rollups in {time.time() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,196 @@
 # train_ai.py
-import pandas as pd
+"""Train the next-10-second hazard forecaster on the logged sensor history.
+
+    python train_ai.py                          # everything in data/safesight.db
+    python train_ai.py --days 30                # only the last 30 days
+    python train_ai.py --update                 # add trees fitted on data logged since the last run
+    python train_ai.py --csv data/gas_log.csv   # legacy CSV log (no timestamps)
+
+History is streamed from the store in chunks and featurized chunk by chunk;
+training rows are kept in a fixed-size uniform sample, so memory stays flat
+however many months of data there are.
+"""
+import argparse
+import os
+import time
+
+import joblib
 import numpy as np
+import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
-import joblib
-import os
 
-print("Training AI Models...")
-
-# Dummy Data to mimic sensors
-data = pd.DataFrame({
-    "Methane ppm": np.random.randint(100, 2000, 500),
-    "CO ppm": np.random.randint(10, 500, 500),
-    "Temp C": np.random.uniform(20.0, 50.0, 500)
-})
-# Targets
-data["methane_next"] = data["Methane ppm"] + 50
-data["co_next"] = data["CO ppm"] + 10
-data["temp_next"] = data["Temp C"] + 0.5
-
-X = data[["Methane ppm", "CO ppm", "Temp C"]]
-
-# Train
-m_model = RandomForestRegressor().fit(X, data["methane_next"])
-c_model = RandomForestRegressor().fit(X, data["co_next"])
-t_model = RandomForestRegressor().fit(X, data["temp_next"])
-
-# Save to 'src' folder
-if not os.path.exists('src'): os.makedirs('src')
-joblib.dump(m_model, 'src/methane_model.pkl')
-joblib.dump(c_model, 'src/co_model.pkl')
-joblib.dump(t_model, 'src/temp_model.pkl')
-
-print("✅ AI Models Created in 'src' folder!")
\ No newline at end of file
+from forecast import HISTORY, HORIZON, METRICS, N_FEATURES, STEP, ResidualForecaster, SeriesStream
+from forest import FOREST_DIR, export_forest
+from inference import MODEL_PATH
+from resources import peak_memory_mb
+from storage import LEGACY_DEVICE, LEGACY_INTERVAL, STORE_PATH, SensorStore
+
+# --- CONFIGURATION ---
+MAX_ROWS = 2000000     # training rows sampled from the history (~300 MB)
+TEST_FRACTION = 0.1    # most recent share of the time range held out for evaluation
+CHUNK_ROWS = 200000    # buckets read and featurized at a time
+MAX_TREES = 300        # --update drops the oldest trees beyond this
+MIN_ROWS = 100
+
+
+class Reservoir:
+    """Uniform sample of at most `capacity` (X, Y) rows from a stream (algorithm R, vectorized)"""
+
+    def __init__(self, capacity, seed=0):
+        self.capacity = capacity
+        self.X = np.empty((capacity, N_FEATURES), dtype=np.float32)
+        self.Y = np.empty((capacity, len(METRICS)))
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, X, Y):
+        n = len(X)
+        fill = min(max(self.capacity - self.seen, 0), n)
+        if fill:
+            self.X[self.seen:self.seen + fill] = X[:fill]
+            self.Y[self.seen:self.seen + fill] = Y[:fill]
+        if n > fill:
+            # Row number i (0-based) replaces a random slot with probability capacity / (i + 1)
+            slot = self.rng.integers(0, self.seen + np.arange(fill, n) + 1)
+            keep = slot < self.capacity
+            self.X[slot[keep]] = X[fill:][keep]
+            self.Y[slot[keep]] = Y[fill:][keep]
+        self.seen += n
+
+    def rows(self):
+        n = min(self.seen, self.capacity)
+        return self.X[:n], self.Y[:n]
+
+
+def store_chunks(store_path, start=None):
+    """(ts, devices, values) chunks of 1 s bucket means, oldest first"""
+    store = SensorStore(store_path)
+    try:
+        for chunk in store.iter_buckets(STEP, start=start, chunksize=CHUNK_ROWS):
+            yield chunk['ts'].to_numpy(), chunk['device_id'].to_numpy(), chunk[list(METRICS)].to_numpy(dtype=float)
+    finally:
+        store.close()
+
+
+def csv_chunks(csv_path):
+    """Legacy `lat,lon,co,gas,temp` log, rows assumed LEGACY_INTERVAL apart from t=0"""
+    offset = 0
+    for df in pd.read_csv(csv_path, chunksize=CHUNK_ROWS):
+        bucket = ((offset + np.arange(len(df))) * LEGACY_INTERVAL // STEP).astype(np.int64)
+        offset += len(df)
+        means = df[list(METRICS)].astype(float).groupby(bucket).mean().dropna()
+        yield means.index.to_numpy() * STEP, np.full(len(means), LEGACY_DEVICE), means.to_numpy()
+
+
+def time_range(args):
+    """(first_ts, last_ts) of the data a run will read"""
+    if args.csv:
+        with open(args.csv) as f:
+            rows = sum(1 for _ in f) - 1
+        return 0.0, rows * LEGACY_INTERVAL
+    store = SensorStore(args.store)
+    lo, hi = store.time_bounds()
+    store.close()
+    return lo, hi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the hazard forecaster")
+    parser.add_argument('--store', default=STORE_PATH)
+    parser.add_argument('--csv', help="train on a legacy CSV log instead of the store")
+    parser.add_argument('--days', type=float, help="only use the most recent DAYS of history")
+    parser.add_argument('--update', action='store_true', help="warm-start: add trees fitted on data since the last run")
+    parser.add_argument('--max-rows', type=int, default=MAX_ROWS)
+    parser.add_argument('--test-fraction', type=float, default=TEST_FRACTION)
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--max-trees', type=int, default=MAX_TREES)
+    parser.add_argument('--max-depth', type=int, default=16)
+    parser.add_argument('--jobs', type=int, default=-1, help="cores used to fit trees (-1 = all)")
+    args = parser.parse_args()
+
+    print("Training AI Models...")
+    wall = time.perf_counter()
+    previous = joblib.load(MODEL_PATH) if args.update else None
+    if previous is not None and getattr(previous, 'trained_until', None) is None:
+        raise SystemExit("❌ --update needs a model trained by this script; run a full training first")
+
+    # --- Stream history into a uniform sample plus a most-recent holdout ---
+    lo, hi = time_range(args)
+    if lo is None:
+        raise SystemExit("❌ No readings logged yet")
+    since = hi - args.days * 86400 if args.days else None
+    if previous is not None and not args.csv:
+        # The CSV log has its own time base (rows from t=0), so trained_until says nothing
+        # about which of its rows are new; --update --csv adds trees fitted on the whole file
+        since = previous.trained_until
+    first = lo if since is None else max(lo, since)
+    test_start = hi - (hi - first) * args.test_fraction if args.test_fraction > 0 else np.inf
+    # Read a little before `since` so the first new rows have their full feature window
+    read_from = None if since is None else since - (HISTORY + HORIZON) * STEP
+    chunks = csv_chunks(args.csv) if args.csv else store_chunks(args.store, read_from)
+
+    train = Reservoir(args.max_rows)
+    test = Reservoir(max(args.max_rows // 10, 1), seed=1)
+    stream = SeriesStream()
+    last_ts = -np.inf
+    started = time.perf_counter()
+    for ts, devices, values in chunks:
+        for row_ts, X, Y in stream.feed(ts, devices, values):
+            new = row_ts > (since if since is not None else -np.inf)
+            row_ts, X, Y = row_ts[new], X[new], Y[new]
+            if len(row_ts):
+                last_ts = max(last_ts, row_ts[-1])
+            held = row_ts >= test_start
+            train.add(X[~held], Y[~held])
+            test.add(X[held], Y[held])
+    X, Y = train.rows()
+    X_test, Y_test = test.rows()
+    print(f"Featurized {train.seen + test.seen} rows in {time.perf_counter() - started:.1f}s "
+          f"(training on {len(X)}, {len(X_test)} held out)")
+    if len(X) < MIN_ROWS:
+        raise SystemExit(f"❌ Only {len(X)} usable rows; log more history (each row needs "
+                         f"{N_FEATURES} features over ~1 min plus the {HORIZON * STEP}s target)")
+
+    # --- Fit ---
+    # One multi-output forest so the dashboard predicts all three targets in a
+    # single call; it learns the change over the horizon, see ResidualForecaster.
+    # Trees are fitted in parallel on all cores.
+    started = time.perf_counter()
+    if previous is None:
+        forest = RandomForestRegressor(n_estimators=args.trees, max_depth=args.max_depth, min_samples_leaf=5,
+                                       n_jobs=args.jobs)
+    else:
+        # warm_start keeps the fitted trees and only grows the new ones on the new rows
+        forest = previous.model
+        forest.set_params(warm_start=True, n_estimators=len(forest.estimators_) + args.trees, n_jobs=args.jobs)
+    forest.fit(X, Y - X[:, :len(METRICS)])
+    if len(forest.estimators_) > args.max_trees:
+        forest.estimators_ = forest.estimators_[-args.max_trees:]
+        forest.n_estimators = args.max_trees
+    model = ResidualForecaster(forest)
+    if previous is None:
+        model.trained_until = last_ts
+    else:
+        model.trained_until = previous.trained_until if args.csv else max(last_ts, previous.trained_until)
+    print(f"Fitted {args.trees} trees on {len(X)} rows in {time.perf_counter() - started:.1f}s "
+          f"({len(forest.estimators_)} trees in the model)")
+
+    if len(X_test):
+        mae = np.abs(model.predict(X_test) - Y_test).mean(axis=0)
+        persistence = np.abs(X_test[:, :len(METRICS)] - Y_test).mean(axis=0)  # "no change" baseline
+        for m, err, base in zip(METRICS, mae, persistence):
+            print(f"  {m:>4}: MAE {err:.2f} at +{HORIZON * STEP}s (no-change baseline {base:.2f})")
+
+    # Save where inference.load_model() looks for it
+    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+    joblib.dump(model, MODEL_PATH)
+
+    # Compact array copy the dashboard memory-maps for fast startup and prediction
+    export_forest(forest, FOREST_DIR, base_features=model.base_features)
+
+    print(f"✅ AI Models Created in 'src' folder! Wall time {time.perf_counter() - wall:.1f}s, "
+          f"peak memory {peak_memory_mb():.0f} MB")
+
+
+if __name__ == '__main__':
+    main()